@@ -0,0 +1,88 @@
+import os
+import sys
+import tempfile
+import threading
+import wave
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import speech_recognition as sr
+
+from lib.classes.audio_encoder import AudioEncoder
+from lib.classes.recognizers import GoogleRecognizer
+from lib.classes.vad_segmenter import segment_wav
+
+# Checks the pre-upload stage of lib.classes.audio_encoder against a local stand-in for the Google
+# endpoint: WAV files with steady-loudness speech between short pauses are cut like the live VAD cuts
+# them, trimmed, resampled and encoded, and posted. Every utterance has to keep (nearly) all of its
+# speech and come back recognized. Prints bytes and encode time per utterance, exits with 1 on failure.
+# Run from the repository root:
+#   python -m benchmarking.audio_encoder_check
+
+# Seconds of uninterrupted speech per file; 15 s is cut into 12 s + 3 s by max_utterance_s
+speech_lengths = [2.5, 6.5, 15]
+sample_rate = 44100
+max_utterance_s = 12
+
+
+def create_steady_wav(path, speech_seconds, amplitude=3000, pause_seconds=.5, seed=0):
+    # A vowel-like tone at constant loudness between two pauses of faint background noise
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(speech_seconds * sample_rate)) / sample_rate
+    speech = amplitude * (.7 * np.sin(2 * np.pi * 180 * t) + .3 * np.sin(2 * np.pi * 360 * t))
+    pause = rng.normal(0, 30, int(pause_seconds * sample_rate))
+    samples = np.concatenate((pause, speech, pause)).astype(np.int16)
+    with wave.open(path, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        file.writeframes(samples.tobytes())
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    # Answers like the Google endpoint, with the uploaded byte count as the transcript
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.rfile.read(length)
+        self.send_response(200)
+        self.end_headers()
+        result = '{"result":[{"alternative":[{"transcript":"%d bytes"}],"final":true}]}' % length
+        self.wfile.write(('{"result":[]}\n' + result + '\n').encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = HTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # One encoder to inspect what is kept, the recognizer's own one counts the uploads
+    encoder = AudioEncoder()
+    recognizer = GoogleRecognizer(encoder=AudioEncoder(), endpoint=f"http://127.0.0.1:{server.server_port}/recognize",
+                                  timeout=5)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as folder:
+        for speech_seconds in speech_lengths:
+            path = os.path.join(folder, f"steady_{speech_seconds}.wav")
+            create_steady_wav(path, speech_seconds)
+            for start, end, pcm in segment_wav(path, max_utterance_s=max_utterance_s):
+                audio = sr.AudioData(pcm, sample_rate, 2)
+                encoded = encoder.encode(audio)
+                text = recognizer.recognize(audio, 'en-US')
+                kept = encoded.duration if encoded is not None else 0
+                ok = text is not None and kept >= .9 * min(end - start, speech_seconds)
+                failures += not ok
+                print(f"{speech_seconds}s speech, cut {start:.2f}-{end:.2f}s: kept {kept:.2f}s, "
+                      f"{len(encoded.data) if encoded is not None else 0} bytes, recognized {text!r}"
+                      f"{'' if ok else ' - FAILED'}")
+
+    server.shutdown()
+    print(f"Uploads: {recognizer.encoder.get_metrics()}")
+    if failures:
+        print(f"{failures} utterances lost speech")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
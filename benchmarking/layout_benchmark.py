@@ -0,0 +1,69 @@
+import json
+import os
+import time
+
+import networkx as nx
+import numpy as np
+
+from lib.classes.timer import ensure_folder_exists
+from lib.community_layout import community_layout, get_executor, layout_community
+from lib.force_layout import barnes_hut_layout
+
+# Compares the layouts of lib.mapper: nx.spring_layout, lib.force_layout.barnes_hut_layout and
+# lib.community_layout.community_layout on random scale-free graphs, which have the hub and
+# leaf structure of co-occurrence maps. community_layout is timed with its process pool and with
+# every community laid out in this process (community_serial), which shows the multi-core speedup.
+# Run from the repository root:
+#   python -m benchmarking.layout_benchmark
+
+test_sizes = [100, 400, 1000, 2000, 5000, 10000]
+# spring_layout is O(N^2) per iteration, larger sizes take minutes
+max_spring_size = 2000
+
+
+def create_test_graph(size, seed=0):
+    G = nx.barabasi_albert_graph(size, 2, seed=seed)
+    rng = np.random.default_rng(seed)
+    for source, target in G.edges:
+        G.edges[source, target]['weight'] = int(rng.integers(1, 5))
+    return G
+
+
+def time_layout(G, layout):
+    start = time.perf_counter()
+    if layout == 'barnes_hut':
+        barnes_hut_layout(G, iterations=50, seed=0)
+    elif layout == 'community':
+        community_layout(G)
+    elif layout == 'community_serial':
+        community_layout(G, parallel_size=float('inf'))
+    else:
+        nx.spring_layout(G, iterations=50, seed=0)
+    return time.perf_counter() - start
+
+
+def main():
+    # Start the pool before timing, its startup is paid once per process and not per layout
+    start = time.perf_counter()
+    get_executor().submit(layout_community, [0], []).result()
+    print(f"{os.cpu_count()} CPUs, process pool started in {time.perf_counter() - start:.2f}s")
+
+    timings = {}
+    for size in test_sizes:
+        G = create_test_graph(size)
+        timings[size] = {'barnes_hut': time_layout(G, 'barnes_hut'), 'community': time_layout(G, 'community'),
+                         'community_serial': time_layout(G, 'community_serial')}
+        if size <= max_spring_size:
+            timings[size]['spring'] = time_layout(G, 'spring')
+        timings[size]['community_speedup'] = timings[size]['community_serial'] / timings[size]['community']
+        print(f"{size} nodes: " + ", ".join(f"{layout} {seconds:.2f}s" for layout, seconds in timings[size].items()
+                                            if layout != 'community_speedup')
+              + f", community pool speedup {timings[size]['community_speedup']:.2f}x")
+
+    ensure_folder_exists()
+    with open("timings/layout_timings.json", 'w') as f:
+        json.dump({'cpu_count': os.cpu_count(), 'timings': timings}, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
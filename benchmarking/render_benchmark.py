@@ -0,0 +1,70 @@
+import json
+import random
+import time
+
+import networkx as nx
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+from lib.classes.timer import ensure_folder_exists
+from lib.plotly_wrapper import create_plot
+
+# Measures create_plot on random scale-free maps: figure build time, JSON serialization time and
+# JSON size, drawn as SVG and with the automatic mode (WebGL above lib.plotly_wrapper.webgl_threshold).
+# Run from the repository root:
+#   python -m benchmarking.render_benchmark
+
+test_sizes = [100, 500, 1000, 2000, 5000, 10000]
+categories = ['NN', 'NE', 'VB', 'JJ', 'ADJ']
+
+
+def create_test_map(size, seed=0):
+    G = nx.barabasi_albert_graph(size, 2, seed=seed)
+    G = nx.relabel_nodes(G, {node: f"word{node}" for node in G.nodes})
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+    for source, target in G.edges:
+        G.edges[source, target]['weight'] = int(rng.integers(1, 5))
+    for node in G.nodes:
+        G.nodes[node]['category'] = random.choice(categories)
+    # Rendering cost doesn't depend on the layout, random positions keep the benchmark about rendering
+    positions = {node: rng.uniform(-1, 1, 2) for node in G.nodes}
+    return G, positions
+
+
+def time_render(G, positions, webgl):
+    start = time.perf_counter()
+    figure = create_plot(G, positions, True, webgl=webgl).to_dict()
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    raw = json.dumps(figure, cls=PlotlyJSONEncoder)
+    return {
+        'build_seconds': build_seconds,
+        'serialize_seconds': time.perf_counter() - start,
+        'json_bytes': len(raw),
+        'traces': len(figure['data']),
+        'webgl': any(trace['type'] == 'scattergl' for trace in figure['data']),
+    }
+
+
+def main():
+    # The first figure pays for loading plotly's validators, keep that out of the timings
+    time_render(*create_test_map(10), False)
+
+    timings = {}
+    for size in test_sizes:
+        G, positions = create_test_map(size)
+        timings[size] = {'svg': time_render(G, positions, False), 'auto': time_render(G, positions, None)}
+        for mode, result in timings[size].items():
+            print(f"{size} nodes, {mode}{' (webgl)' if result['webgl'] else ''}: build {result['build_seconds']:.3f}s, "
+                  f"serialize {result['serialize_seconds']:.3f}s, {result['json_bytes'] / 1024:.0f} KB, "
+                  f"{result['traces']} traces")
+
+    ensure_folder_exists()
+    with open("timings/render_timings.json", 'w') as f:
+        json.dump(timings, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,10 @@ import threading
 
 import speech_recognition as sr
 import os
-import queue
 import keyboard
-from datetime import datetime
 
 from lib.classes.background_processor import BackgroundProcessor
+from lib.classes.live_session import LiveSession
 from dash.dependencies import Input, Output
 from dash import Dash, dash, html, dcc
 
@@ -30,22 +29,21 @@ app.layout = html.Div([
     )
 ])
 
-processing_flag = False
 recorded_segments = 0
+shown_version = 0
 processor = BackgroundProcessor()
 
 
-def voice_to_text(q, stop_event_ref):
+def voice_to_text(stop_event_ref):
     def recognize_audio(audio_source):
         global recorded_segments
         try:
             # could be replaced with cog services
             # https://learn.microsoft.com/de-de/azure/cognitive-services/speech-service/how-to-recognize-speech?pivots=programming-language-python
-            text = r.recognize_google(audio_source, language=google_lang[selected_lang])
-            q.put(text + " ")
+            text = r.recognize_google(audio_source, language=google_lang[session.selected_lang])
+            # The session writes the transcript and hands the new segment to the processor
+            recorded_segments = session.add_text(text + " ")
             print(f"Task {recorded_segments} - Recognized Text: {text}")
-            recorded_segments += 1
-            update_plot(q, recorded_segments)
         except sr.UnknownValueError:
             print("couldn't understand audio.", end="")
         except sr.RequestError as e:
@@ -66,37 +64,18 @@ def voice_to_text(q, stop_event_ref):
             recognition_thread.start()
 
 
-def update_plot(q, n):
-    global accumulated_text
-    while not q.empty():
-        text = q.get()  # Get the latest recognized text
-        accumulated_text += text
-        with open(transcript_file, 'a', encoding='utf-8') as file:
-            file.write(text)
-        with open(latest_transcript_file, 'a', encoding='utf-8') as file:
-            file.write(text)
-        processor.add_task((accumulated_text, selected_lang, conversation_id, n))
-
-
 @app.callback(
     Output('live-graph', 'figure'),
     [Input('graph-update', 'n_intervals')],
 )
 def update_graph_scatter(n):
-    global accumulated_text, previous_accumulated_text, processing_flag
-    if accumulated_text != previous_accumulated_text and accumulated_text != "" and not processing_flag:
-        processing_flag = True
-        previous_accumulated_text = accumulated_text
-        print(f"Task {recorded_segments} - Updating plot...")
-
-        figure = processor.get_data()  # Get the latest processed data
-
-        if figure is not None:
-            print(f"Task {recorded_segments} - Plot updated!")
-            processing_flag = False
-            return figure
-    else:
+    global shown_version
+    version, figure = processor.get_latest()
+    if figure is None or version == shown_version:
         return dash.no_update
+    shown_version = version
+    print(f"Task {recorded_segments} - Plot updated!")
+    return figure
 
 
 started = False
@@ -112,16 +91,10 @@ if not started:
     print(f"Selected language: {selected_lang}")
 
     r = sr.Recognizer()
-    accumulated_text = ""
-    previous_accumulated_text = ""
 
-    # use current timestamp as unique identifier for the transcript
-    conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
-    transcript_file = f"transcripts/transcript_{conversation_id}.txt"
     latest_transcript_file = f"transcripts/transcript_latest.txt"
-
-    # Create a queue to store the recognized text
-    text_queue = queue.Queue()
+    # Holds the transcript and conversation id, and sends only new segments to the processor
+    session = LiveSession('default', selected_lang, processor, latest_transcript_file=latest_transcript_file)
 
     # Create an event to control the audio recording
     stop_event = threading.Event()
@@ -134,23 +107,19 @@ if not started:
         with lock:
             print("Stopping...")
             stop_event.set()
+            session.close()
             sys.exit()
 
 
     def handle_lang_change(event):
-        global selected_lang
-        selected_lang = languages[1] if selected_lang == languages[0] else languages[0]
-        print(f"Changed language to {selected_lang}")
+        lang = session.toggle_language(languages)
+        print(f"Changed language to {lang}")
 
 
     def handle_reset(event):
-        global accumulated_text, conversation_id, transcript_file
-        accumulated_text = ""
         print("Resetting...")
-        conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
-        transcript_file = f"transcripts/transcript_{conversation_id}.txt"
-        with open(latest_transcript_file, 'w', encoding='utf-8') as file:
-            file.write("")
+        # New conversation id and transcript file, the latest transcript file is truncated
+        session.reset()
 
 
     # Register the stop key press callback
@@ -163,7 +132,7 @@ if not started:
         os.makedirs('transcripts')
 
     # Create a thread for continuous audio recording
-    audio_thread = threading.Thread(target=voice_to_text, args=(text_queue, stop_event))
+    audio_thread = threading.Thread(target=voice_to_text, args=(stop_event,))
     print("Starting audio thread...")
     audio_thread.start()
     log = logging.getLogger('werkzeug')
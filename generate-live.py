@@ -1,100 +1,270 @@
+import asyncio
+import json
 import logging
 import sys
 import threading
+import time
 
 import speech_recognition as sr
 import os
-import queue
 import keyboard
-from datetime import datetime
-
-from lib.classes.background_processor import BackgroundProcessor
-from dash.dependencies import Input, Output
-from dash import Dash, dash, html, dcc
-
-app = Dash(__name__)
-
-app.layout = html.Div([
-    dcc.Checklist(
-        id='show-labels',
-        options=[
-            {'label': 'Show Labels', 'value': 'show'}
-        ],
-        value=['show']
-    ),
-    dcc.Graph(id='live-graph', animate=True, style={'height': '100vh'}),
-    dcc.Interval(
-        id='graph-update',
-        interval=1 * 1000,  # in milliseconds
-        n_intervals=0
-    )
-])
-
-processing_flag = False
-recorded_segments = 0
-processor = BackgroundProcessor()
-
-
-def voice_to_text(q, stop_event_ref):
+
+from flask import Response, g, request
+
+from lib.classes.async_pipeline import AsyncPipeline, PipelineStage
+from lib.classes.audio_encoder import AudioEncoder
+from lib.classes.hedged_recognizer import HedgedRecognizer
+from lib.classes.metrics import registry
+from lib.classes.recognition_pool import RecognitionPool
+from lib.classes.recognizers import GoogleRecognizer
+from lib.classes.vad_segmenter import VadSegmenter, listen_vad
+from lib.classes.session_manager import SessionManager, SessionLimitError
+from lib.detail_levels import apply_detail_level, get_trace_level, get_zoom_detail_level
+from lib.replay import load_replay, replay, summarize_latencies
+from dash.dependencies import Input, Output, State
+from dash import Dash, Patch, ctx, dash, html, dcc
+
+# How long a graph update request waits for the processor before giving up
+long_poll_timeout = .9
+local_session_id = 'default'
+# Created in __main__ so that worker processes importing this module don't start their own
+session_manager = None
+recognizer = None
+audio_pipeline = None
+recognition_pool = None
+# Utterances recognized in parallel, and how long one may take before it is skipped
+recognition_workers = 4
+recognition_timeout = 30
+# Per request deadline and retries; all attempts together have to fit into recognition_timeout
+recognition_deadline = 8
+recognition_retries = 2
+# Longest utterance sent to recognition while someone speaks without pausing
+max_utterance_s = 12
+# Nodes per detail level: the map starts with the most important ones and adds more when zooming in
+detail_level_sizes = (40, 120, 400)
+
+
+def get_session_id(pathname):
+    parts = (pathname or '').strip('/').split('/')
+    if len(parts) >= 2 and parts[0] == 'session':
+        return parts[1]
+    return local_session_id
+
+
+def voice_to_text():
+    global audio_pipeline, recognition_pool
+
     def recognize_audio(audio_source):
-        global recorded_segments
+        # Streams hypotheses to the pool, which passes partials on to publish_partial
+        session = session_manager.get(local_session_id)
+        start = time.perf_counter()
         try:
-            text = r.recognize_google(audio_source, language=google_lang[selected_lang])
-            q.put(text + " ")
-            print(f"Task {recorded_segments} - Recognized Text: {text}")
-            recorded_segments += 1
-            update_plot(q, recorded_segments)
-        except sr.UnknownValueError:
-            print("couldn't understand audio.", end="")
+            yield from recognizer.stream(audio_source, google_lang[session.selected_lang])
         except sr.RequestError as e:
             print("Could not request results from Google Speech Recognition service; {0}".format(e))
-        except Exception as e:
-            print(e)
+        registry.observe('live_stage_latency_seconds', time.perf_counter() - start,
+                         help_text="Time spent per pipeline stage", session=local_session_id, stage='recognition')
+
+    def publish_partial(text):
+        session_manager.get(local_session_id).set_partial(text)
+
+    def publish_text(text, captured_at):
+        # Called in capture order. Appends to the session, which hands the new segment to its processor
+        n = session_manager.get(local_session_id).add_text(text + " ", captured_at)
+        print(f"Task {n} - Recognized Text: {text}")
+
+    def submit_audio(audio_source, captured_at):
+        # Blocks while the pool is full, which holds back capture through the pipeline queue
+        recognition_pool.submit(audio_source, captured_at)
+
+    def reset():
+        recognition_pool.reset()
+        session_manager.get(local_session_id).reset()
+
+    recognition_pool = RecognitionPool(recognize_audio, publish_text, recognition_workers, recognition_timeout,
+                                       on_partial=publish_partial)
 
     with sr.Microphone(device_index=0) as source:
-        while not stop_event_ref.is_set():
+        # Cuts utterances at natural pauses instead of waiting for a fixed phrase time limit
+        segmenter = VadSegmenter(sample_rate=source.SAMPLE_RATE, max_utterance_s=max_utterance_s)
+
+        def capture_audio():
             print("Recording...", end="")
-            try:
-                audio = r.listen(source, phrase_time_limit=20)
-            except sr.WaitTimeoutError:
-                print("no speech detected. Trying again...")
-                continue
-
-            recognition_thread = threading.Thread(target=recognize_audio, args=(audio,))
-            recognition_thread.start()
-
-
-def update_plot(q, n):
-    global accumulated_text
-    while not q.empty():
-        text = q.get()  # Get the latest recognized text
-        accumulated_text += text
-        with open(transcript_file, 'a', encoding='utf-8') as file:
-            file.write(text)
-        with open(latest_transcript_file, 'a', encoding='utf-8') as file:
-            file.write(text)
-        processor.add_task((accumulated_text, selected_lang, conversation_id, n))
-
-
-@app.callback(
-    Output('live-graph', 'figure'),
-    [Input('graph-update', 'n_intervals')],
-)
-def update_graph_scatter(n):
-    global accumulated_text, previous_accumulated_text, processing_flag
-    if accumulated_text != previous_accumulated_text and accumulated_text != "" and not processing_flag:
-        processing_flag = True
-        previous_accumulated_text = accumulated_text
-        print(f"Task {recorded_segments} - Updating plot...")
-
-        figure = processor.get_data()  # Get the latest processed data
-
-        if figure is not None:
-            print(f"Task {recorded_segments} - Plot updated!")
-            processing_flag = False
-            return figure
-    else:
-        return dash.no_update
+            return listen_vad(source, segmenter, audio_pipeline.stopping)
+
+        # Only capture and submission to the recognition pool are pipeline stages; a full pool holds
+        # back capture. Map building and publishing run outside the pipeline with no backpressure:
+        # a slow map build doesn't hold back capture, the background processor coalesces what queued up.
+        audio_pipeline = AsyncPipeline(capture_audio, [PipelineStage('recognition', submit_audio)], on_reset=reset)
+        asyncio.run(audio_pipeline.run())
+    recognition_pool.shutdown()
+
+
+def replay_to_text(source, speed):
+    # Stands in for voice_to_text: feeds a transcript or WAV file into the local session
+    segments, fake_recognizer = load_replay([source])
+    print(f"Replaying {len(segments)} segments from {source} at speed {speed}...")
+    latencies = replay(session_manager.get(local_session_id), segments, speed, fake_recognizer,
+                       recognition_workers, recognition_timeout)
+    print(f"Replay - End-to-end latency: {json.dumps(summarize_latencies(latencies))}")
+
+
+def update_detail_level(processor, known_version, relayout_data, detail_level):
+    # Zooming only toggles which of the already sent traces are visible
+    figure = processor.get_version_data(known_version)
+    if figure is None:
+        return dash.no_update, dash.no_update, dash.no_update
+    level = get_zoom_detail_level(relayout_data, figure, len(detail_level_sizes))
+    if level is None or level == detail_level:
+        return dash.no_update, dash.no_update, dash.no_update
+
+    patch = Patch()
+    for i, trace in enumerate(figure.get('data', [])):
+        trace_level = get_trace_level(trace)
+        if (trace_level <= level) != (trace_level <= detail_level):
+            patch['data'][i]['visible'] = trace_level <= level
+    return patch, dash.no_update, level
+
+
+def update_graph_scatter(n, relayout_data, known_version, detail_level, pathname):
+    # Page views only show existing sessions, they are created by the microphone or by posting segments
+    session = session_manager.get(get_session_id(pathname))
+    if session is None:
+        return dash.no_update, dash.no_update, dash.no_update
+    processor = session.processor
+    figure_cache = session.figure_cache
+
+    if ctx.triggered_id == 'live-graph':
+        return update_detail_level(processor, known_version, relayout_data, detail_level)
+
+    # Wait until the processor publishes a new figure instead of polling for one
+    version = processor.wait_for_update(known_version, timeout=long_poll_timeout)
+    if version == known_version:
+        figure_cache.record_not_modified()
+        return dash.no_update, dash.no_update, dash.no_update
+
+    figure = processor.get_version_data(version)
+    if figure is None:
+        return dash.no_update, dash.no_update, dash.no_update
+    # Always the whole figure: traces are batched and every frame moves every node, so a diff
+    # against the browser's figure changes all traces anyway. Dash serializes it again for every
+    # viewer and poll; only /figure serves the bytes cached in figure_cache.
+    print(f"Session {session.session_id} - Plot updated")
+    # Bytes are counted by record_figure_bytes once Dash has serialized the response
+    g.figure_cache = figure_cache
+    return apply_detail_level(figure, detail_level), version, dash.no_update
+
+
+def record_figure_bytes(response):
+    # Counts what Dash actually sends for a figure update without serializing it a second time
+    figure_cache = g.pop('figure_cache', None)
+    if figure_cache is not None:
+        figure_cache.record_sent(response.calculate_content_length() or 0)
+    return response
+
+
+def get_figure(session_id):
+    # Latest figure as pre-compressed JSON, for clients other than the Dash page.
+    # The conversation id and processor version make the ETag, so unchanged figures cost a 304 and
+    # a session that was closed and created again (versions restart at 0) can't match an old one.
+    session = session_manager.get(session_id)
+    if session is None:
+        return Response(status=404)
+    figure_cache = session.figure_cache
+    version, figure = session.processor.get_latest()
+    etag = f'"{session.conversation_id}-{version}"'
+    if figure is None:
+        return Response(status=204)
+    if request.headers.get('If-None-Match') == etag:
+        figure_cache.record_not_modified()
+        return Response(status=304, headers={'ETag': etag})
+
+    raw, compressed = figure_cache.get(version, figure)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        figure_cache.record_sent(len(compressed), len(raw))
+        return Response(compressed, mimetype='application/json',
+                        headers={'ETag': etag, 'Content-Encoding': 'gzip', 'Vary': 'Accept-Encoding'})
+    figure_cache.record_sent(len(raw))
+    return Response(raw, mimetype='application/json', headers={'ETag': etag, 'Vary': 'Accept-Encoding'})
+
+
+def get_figure_metrics(session_id):
+    session = session_manager.get(session_id)
+    if session is None:
+        return Response(status=404)
+    return {**session.figure_cache.get_metrics(), **session.processor.get_metrics()}
+
+
+def get_metrics():
+    session_manager.update_metrics()
+    if recognition_pool is not None:
+        for key, value in recognition_pool.get_metrics().items():
+            registry.set(f"live_{key}", value, help_text="Recognition worker pool state", session=local_session_id)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def post_segment(session_id):
+    # Lets recorders in other rooms feed recognized text into their own session.
+    # Text sent with "final": false is shown tentatively until the final text arrives.
+    payload = request.get_json(silent=True) or {}
+    text = payload.get('text', '').strip()
+    if not text:
+        return Response("Missing 'text'", status=400)
+    try:
+        session = session_manager.get_or_create(session_id)
+    except ValueError as e:
+        return Response(str(e), status=400)
+    except SessionLimitError as e:
+        return Response(str(e), status=503)
+    if 'lang' in payload and payload['lang'] in languages:
+        session.selected_lang = payload['lang']
+    if not payload.get('final', True):
+        session.set_partial(text)
+        return {'session_id': session_id, 'segment': None}
+    n = session.add_text(text + " ")
+    return {'session_id': session_id, 'segment': n}
+
+
+def create_app():
+    # Built in __main__ so that worker processes importing this module don't start their own
+    app = Dash(__name__)
+
+    app.layout = html.Div([
+        # /session/<id> shows that conversation, everything else shows the local microphone session
+        dcc.Location(id='url', refresh=False),
+        dcc.Checklist(
+            id='show-labels',
+            options=[
+                {'label': 'Show Labels', 'value': 'show'}
+            ],
+            value=['show']
+        ),
+        dcc.Graph(id='live-graph', animate=True, style={'height': '100vh'}),
+        # Version of the figure the browser currently shows
+        dcc.Store(id='figure-version', data=0),
+        # Finest detail level shown, follows the zoom
+        dcc.Store(id='detail-level', data=0),
+        # Only re-arms the long poll in update_graph_scatter, which waits for the processor
+        dcc.Interval(
+            id='graph-update',
+            interval=1 * 1000,  # in milliseconds
+            n_intervals=0
+        )
+    ])
+
+    app.callback(
+        [Output('live-graph', 'figure'), Output('figure-version', 'data'), Output('detail-level', 'data')],
+        [Input('graph-update', 'n_intervals'), Input('live-graph', 'relayoutData')],
+        [State('figure-version', 'data'), State('detail-level', 'data'), State('url', 'pathname')],
+    )(update_graph_scatter)
+    app.server.after_request(record_figure_bytes)
+    app.server.route('/figure', defaults={'session_id': local_session_id})(get_figure)
+    app.server.route('/session/<session_id>/figure')(get_figure)
+    app.server.route('/figure/metrics', defaults={'session_id': local_session_id})(get_figure_metrics)
+    app.server.route('/session/<session_id>/figure/metrics')(get_figure_metrics)
+    app.server.route('/metrics')(get_metrics)
+    app.server.route('/session/<session_id>/segments', methods=['POST'])(post_segment)
+    return app
 
 
 started = False
@@ -109,21 +279,8 @@ if not started:
     selected_lang = 'de'
     print(f"Selected language: {selected_lang}")
 
-    r = sr.Recognizer()
-    accumulated_text = ""
-    previous_accumulated_text = ""
-
-    # use current timestamp as unique identifier for the transcript
-    conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
-    transcript_file = f"transcripts/transcript_{conversation_id}.txt"
     latest_transcript_file = f"transcripts/transcript_latest.txt"
 
-    # Create a queue to store the recognized text
-    text_queue = queue.Queue()
-
-    # Create an event to control the audio recording
-    stop_event = threading.Event()
-
     # Create a lock to synchronize access to the accumulated text
     lock = threading.Lock()
 
@@ -131,44 +288,69 @@ if not started:
     def stop_key_press(event):
         with lock:
             print("Stopping...")
-            stop_event.set()
+            if audio_pipeline is not None:
+                audio_pipeline.stop()
             sys.exit()
 
 
     def handle_lang_change(event):
-        global selected_lang
-        selected_lang = languages[1] if selected_lang == languages[0] else languages[0]
-        print(f"Changed language to {selected_lang}")
+        lang = session_manager.get(local_session_id).toggle_language(languages)
+        print(f"Changed language to {lang}")
 
 
     def handle_reset(event):
-        global accumulated_text, conversation_id, transcript_file
-        accumulated_text = ""
         print("Resetting...")
-        conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
-        transcript_file = f"transcripts/transcript_{conversation_id}.txt"
-        with open(latest_transcript_file, 'w', encoding='utf-8') as file:
-            file.write("")
+        # Also drops audio and text still in flight from before the reset
+        if audio_pipeline is not None:
+            audio_pipeline.reset()
+        else:
+            session_manager.get(local_session_id).reset()
 
 
-    # Register the stop key press callback
-    keyboard.on_press_key("F2", stop_key_press)
-    keyboard.on_press_key("F4", handle_lang_change)
-    keyboard.on_press_key("F3", handle_reset)
+    log = logging.getLogger('werkzeug')
+    log.setLevel(logging.ERROR)
+
+started = True
+
+if __name__ == '__main__':
+    r = sr.Recognizer()
+    # Any lib.classes.recognizers.Recognizer works here, streaming ones update the map on partial results.
+    # Utterances are trimmed and sent as 16 kHz FLAC to keep uploads small. Requests that take
+    # longer than usual are duplicated, and ones that fail or miss their deadline are retried.
+    # Each attempt gives up at its deadline, so an abandoned request doesn't hold a thread of the recognizer's pool
+    recognizer = HedgedRecognizer(GoogleRecognizer(r, encoder=AudioEncoder(name=local_session_id),
+                                                   timeout=recognition_deadline),
+                                  deadline=recognition_deadline, max_retries=recognition_retries,
+                                  name=local_session_id)
+    app = create_app()
+
+    # Pass --worker-process to run punctuation, co-occurrence, layout and figure building in a separate process
+    session_manager = SessionManager(default_lang=selected_lang, use_worker_process='--worker-process' in sys.argv,
+                                     level_sizes=detail_level_sizes)
 
     # check if the directory exists. If not, create it
     if not os.path.exists('transcripts'):
         os.makedirs('transcripts')
 
-    # Create a thread for continuous audio recording
-    audio_thread = threading.Thread(target=voice_to_text, args=(text_queue, stop_event))
+    # The microphone on this machine feeds the default session
+    session_manager.get_or_create(local_session_id, latest_transcript_file=latest_transcript_file, pinned=True)
+
+    # Register the stop key press callback
+    keyboard.on_press_key("F2", stop_key_press)
+    keyboard.on_press_key("F4", handle_lang_change)
+    keyboard.on_press_key("F3", handle_reset)
+
+    # Create a thread for continuous audio recording, or with --replay <transcript or wav> [--speed <factor>]
+    # one that replays a recording instead
+    if '--replay' in sys.argv:
+        replay_speed = float(sys.argv[sys.argv.index('--speed') + 1]) if '--speed' in sys.argv else 1.0
+        audio_thread = threading.Thread(target=replay_to_text, daemon=True,
+                                        args=(sys.argv[sys.argv.index('--replay') + 1], replay_speed))
+    else:
+        audio_thread = threading.Thread(target=voice_to_text, daemon=True)
     print("Starting audio thread...")
     audio_thread.start()
-    log = logging.getLogger('werkzeug')
-    log.setLevel(logging.ERROR)
-
-started = True
 
-if __name__ == '__main__':
     os.system("start http://127.0.0.1:7080")
     app.run_server(host='127.0.0.1', port='7080', proxy=None, debug=False, dev_tools_ui=None)
+    session_manager.close_all()
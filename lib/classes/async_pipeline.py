@@ -0,0 +1,105 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+
+
+class PipelineStage:
+    def __init__(self, name, function, concurrency=1):
+        # function is blocking and runs in the stage's executor. It returns the item
+        # for the next stage, or None to drop it.
+        self.name = name
+        self.function = function
+        self.concurrency = concurrency
+
+
+class AsyncPipeline:
+    def __init__(self, source, stages, queue_size=4, on_reset=None):
+        # source is a blocking callable producing one item per call (None if there was nothing),
+        # e.g. one captured utterance. Items flow through bounded queues, so a slow stage makes
+        # the stages before it wait instead of piling up work.
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_reset = on_reset
+        self.loop = None
+        self.queues = []
+        self.tasks = []
+        self.executors = []
+        # Items captured before the last reset are dropped wherever they are in the pipeline
+        self.generation = 0
+        # Set by stop(), for sources that need to return early
+        self.stopping = Event()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.executors = [ThreadPoolExecutor(max_workers=1, thread_name_prefix='capture')]
+        self.tasks = [asyncio.create_task(self._run_source(self.executors[0], self.queues[0]))]
+        for i, stage in enumerate(self.stages):
+            executor = ThreadPoolExecutor(max_workers=stage.concurrency, thread_name_prefix=stage.name)
+            self.executors.append(executor)
+            output_queue = self.queues[i + 1] if i + 1 < len(self.queues) else None
+            for _ in range(stage.concurrency):
+                self.tasks.append(asyncio.create_task(self._run_stage(stage, executor, self.queues[i], output_queue)))
+
+        try:
+            await asyncio.gather(*self.tasks)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # Blocking calls can't be interrupted, so stages aren't waited for. Capture is,
+            # since the caller closes the audio source as soon as this returns.
+            for executor in self.executors[1:]:
+                executor.shutdown(wait=False)
+            self.executors[0].shutdown(wait=True)
+
+    async def _run_source(self, executor, output_queue):
+        while True:
+            generation = self.generation
+            item = await self.loop.run_in_executor(executor, self.source)
+            captured_at = time.time()
+            if item is not None and generation == self.generation:
+                await output_queue.put((generation, captured_at, item))
+
+    async def _run_stage(self, stage, executor, input_queue, output_queue):
+        while True:
+            generation, captured_at, item = await input_queue.get()
+            try:
+                if generation != self.generation:
+                    continue
+                try:
+                    result = await self.loop.run_in_executor(executor, stage.function, item, captured_at)
+                except Exception as e:
+                    print(f"Stage {stage.name} failed: {e}")
+                    continue
+                if result is not None and output_queue is not None and generation == self.generation:
+                    await output_queue.put((generation, captured_at, result))
+            finally:
+                input_queue.task_done()
+
+    def _reset(self):
+        self.generation += 1
+        for queue in self.queues:
+            while not queue.empty():
+                queue.get_nowait()
+                queue.task_done()
+        if self.on_reset is not None:
+            self.on_reset()
+
+    def _cancel(self):
+        for task in self.tasks:
+            task.cancel()
+
+    def reset(self):
+        # Thread-safe: drops everything in flight and calls on_reset from the event loop
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._reset)
+        elif self.on_reset is not None:
+            self.on_reset()
+
+    def stop(self):
+        # Thread-safe
+        self.stopping.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._cancel)
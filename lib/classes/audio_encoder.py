@@ -0,0 +1,83 @@
+import time
+from collections import namedtuple
+from math import gcd
+
+import numpy as np
+import speech_recognition as sr
+from scipy.signal import resample_poly
+
+from lib.classes.metrics import registry
+from lib.classes.vad_segmenter import frame_features
+
+byte_buckets = [4000, 8000, 16000, 32000, 64000, 128000, 256000, 512000, 1024000]
+
+EncodedAudio = namedtuple('EncodedAudio', ['data', 'content_type', 'sample_rate', 'duration'])
+
+
+def resample(samples, from_rate, to_rate):
+    if from_rate == to_rate:
+        return samples
+    divisor = gcd(from_rate, to_rate)
+    resampled = resample_poly(samples.astype(np.float32), to_rate // divisor, from_rate // divisor)
+    return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+
+def trim_silence(samples, sample_rate, frame_ms=30, min_energy=300, padding_ms=150):
+    # Cuts leading and trailing frames below min_energy, the VAD's lowest speech level. An absolute
+    # level rather than one relative to the utterance, which would end up above steady speech.
+    # The VAD already decided this is speech, so if no frame reaches the level nothing is cut.
+    frame_length = int(sample_rate * frame_ms / 1000)
+    frame_total = len(samples) // frame_length
+    if frame_total == 0:
+        return samples
+    energy, _ = frame_features(samples[:frame_total * frame_length].reshape(frame_total, frame_length))
+    voiced = np.flatnonzero(energy > min_energy)
+    if len(voiced) == 0:
+        return samples
+    padding = int(padding_ms / frame_ms)
+    start = max(voiced[0] - padding, 0) * frame_length
+    end = min(voiced[-1] + 1 + padding, frame_total) * frame_length
+    return samples[start:end]
+
+
+class AudioEncoder:
+    def __init__(self, sample_rate=16000, trim=True, name='default'):
+        # Prepares utterances for upload: convert to 16 bit, trim silence, resample to the
+        # recognizer's preferred rate and encode as FLAC (lossless, what the Google API expects).
+        # name is the session label on the byte and encode time metrics.
+        self.sample_rate = sample_rate
+        self.trim = trim
+        self.name = name
+        self.utterances = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    def encode(self, audio):
+        start = time.perf_counter()
+        raw = audio.get_raw_data(convert_width=2)
+        samples = np.frombuffer(raw, dtype=np.int16)
+        if self.trim:
+            samples = trim_silence(samples, audio.sample_rate)
+        samples = resample(samples, audio.sample_rate, self.sample_rate)
+        if len(samples) == 0:
+            return None
+
+        data = sr.AudioData(samples.tobytes(), self.sample_rate, 2).get_flac_data()
+        encode_seconds = time.perf_counter() - start
+
+        self.utterances += 1
+        self.raw_bytes += len(raw)
+        self.encoded_bytes += len(data)
+        registry.observe('live_upload_bytes', len(data), help_text="Encoded audio bytes per utterance",
+                         buckets=byte_buckets, session=self.name)
+        registry.observe('live_encode_seconds', encode_seconds, help_text="Time to trim, resample and encode an utterance",
+                         session=self.name)
+        return EncodedAudio(data, f"audio/x-flac; rate={self.sample_rate}", self.sample_rate,
+                            len(samples) / self.sample_rate)
+
+    def get_metrics(self):
+        return {
+            'encoded_utterances': self.utterances,
+            'raw_audio_bytes': self.raw_bytes,
+            'encoded_audio_bytes': self.encoded_bytes,
+        }
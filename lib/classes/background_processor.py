@@ -1,48 +1,184 @@
-from queue import Queue
-from threading import Thread
 import time
+from collections import OrderedDict
+from queue import Queue, Empty
+from threading import Thread, Condition
 
-from deepmultilingualpunctuation import PunctuationModel
-
-from lib.advanced_text_processing import extract_logical_links_advanced, get_preprocessed_sentences
-from lib.mapper import create_mind_map_force
-from lib.plotly_wrapper import create_plot
+from lib.classes.map_builder import MapBuilder
+from lib.classes.metrics import registry
+from lib.classes.process_worker import ProcessWorker, WorkerTaskError
 
 
 class BackgroundProcessor:
-    def __init__(self):
+    def __init__(self, link_cache_size=2048, use_worker_process=False, history_size=4,
+                 punctuation_model=None, punctuation_lock=None, max_text_length=None, name='default', level_sizes=None,
+                 worker=None):
+        # Used as the session label on metrics, and as the key of this session's state in a shared worker
+        self.name = name
         self.queue = Queue()
         self.data = None
+        # Incremented for every new figure; waiters on the condition are woken up
+        self.version = 0
+        self.condition = Condition()
+        self.history = OrderedDict()
+        self.history_size = history_size
+        self.processed_tasks = 0
+        self.dropped_tasks = 0
+        self.last_rendered_conversation_id = None
+        self.last_rendered_segment_id = -1
+        # Optional on_rendered(segments, rendered_at), called once segments are part of a published figure
+        self.on_rendered = None
+        self.use_worker_process = use_worker_process or worker is not None
+        if self.use_worker_process:
+            # The pipeline runs in a separate process, only figures come back. A worker passed in
+            # is shared with other sessions (see SessionManager), otherwise this processor starts its own.
+            self.builder = None
+            self.owns_worker = worker is None
+            if worker is None:
+                worker = ProcessWorker(link_cache_size, max_text_length=max_text_length, level_sizes=level_sizes)
+                worker.start()
+            self.worker = worker
+            # Everything sent to the worker in the current conversation, to replay after a crash
+            self.sent_conversation_id = None
+            self.sent_segments = []
+        else:
+            self.builder = MapBuilder(link_cache_size, punctuation_model, punctuation_lock, max_text_length, level_sizes)
+            self.worker = None
+            self.owns_worker = False
+        self.running = True
         self.thread = Thread(target=self._process, daemon=True)
         self.thread.start()
-        self.punctuation_model = PunctuationModel()
-        self.sentence_map = {}
 
     def add_task(self, task):
         self.queue.put(task)
 
-    def _process(self):
+    def stop(self):
+        self.running = False
+        # Wake up the processor thread so it can exit
+        self.queue.put(None)
+        if self.owns_worker:
+            self.worker.stop()
+        elif self.worker is not None:
+            self.worker.forget(self.name)
+
+    def _get_latest_task(self):
+        # Block for the next task, then fold any queued behind it into one.
+        # Tasks only carry new segments, so their segments are merged while the
+        # newest task's language, number and partial text win.
+        task = self.queue.get()
         while True:
-            task = self.queue.get()
+            try:
+                newer_task = self.queue.get_nowait()
+            except Empty:
+                return task
+            if task is not None and newer_task is not None:
+                self.dropped_tasks += 1
+                registry.inc('live_dropped_tasks_total', help_text="Tasks merged into a newer one before processing",
+                             session=self.name)
+                if task[2] == newer_task[2]:
+                    newer_task = (task[0] + newer_task[0],) + newer_task[1:]
+            task = newer_task
+
+    def _record_sent_segments(self, task):
+        segments, selected_lang, conversation_id, n, partial_text = task
+        if conversation_id != self.sent_conversation_id:
+            self.sent_conversation_id = conversation_id
+            self.sent_segments = []
+        self.sent_segments.extend(segments)
+
+    def _process(self):
+        while self.running:
+            task = self._get_latest_task()
             if task is not None:
-                print(f"Task {task[3]} - Processing...")
-                text, selected_lang, conversation_id, n = task
-                text = self.punctuation_model.restore_punctuation(text)
-                sentences = get_preprocessed_sentences(text)
-                if len(sentences) > 1:
-                    for i in range(len(sentences) - 1):
-                        if sentences[i] not in self.sentence_map:
-                            sentence = sentences[i] + sentences[i + 1]
-                            self.sentence_map[i] = extract_logical_links_advanced(sentence, selected_lang, True)
-
-                logical_links = []
-                for i in range(len(sentences) - 1):
-                    logical_links.extend(self.sentence_map[i])
-
-                print(f"Task {n} - Logical links: {len(logical_links)}")
-                G, positions = create_mind_map_force(logical_links)
-                self.data = create_plot(G, positions, True, title=f"Transcript: {conversation_id} ({len(text)} characters - task {n})")
-            time.sleep(.1)
+                print(f"Task {task[3]} - Processing... (dropped {self.dropped_tasks} stale tasks so far)")
+                if self.worker is not None:
+                    try:
+                        self._record_sent_segments(task)
+                        figure = self.worker.run(task, lambda: (list(self.sent_segments),) + task[1:], self.name)
+                    except WorkerTaskError as e:
+                        # The restarted worker must not be sent the segments it failed on again
+                        failed_ids = {segment.id for segment in task[0]}
+                        self.sent_segments = [segment for segment in self.sent_segments
+                                              if segment.id not in failed_ids]
+                        print(f"Task {task[3]} - Dropped {len(failed_ids)} segments: {e}")
+                        figure = None
+                    except RuntimeError as e:
+                        print(f"Task {task[3]} - {e}")
+                        figure = None
+                else:
+                    try:
+                        figure = self.builder.build(task)
+                    except Exception as e:
+                        # Like in the worker process, a failing task must not end the processor thread
+                        print(f"Task {task[3]} - Processing failed: {e!r}")
+                        figure = None
+                if figure is not None:
+                    self._publish(figure)
+                    self._record_task_metrics(task)
+                self.processed_tasks += 1
+                registry.inc('live_processed_tasks_total', help_text="Tasks processed into a figure",
+                             session=self.name)
+
+    def _record_task_metrics(self, task):
+        segments, selected_lang, conversation_id, n, partial_text = task
+        if self.worker is not None:
+            stage_timings = self.worker.get_metrics(self.name).get('stage_timings', {})
+        else:
+            stage_timings = self.builder.stage_timings
+        for stage, seconds in stage_timings.items():
+            registry.observe('live_stage_latency_seconds', seconds, help_text="Time spent per pipeline stage",
+                             session=self.name, stage=stage)
+
+        # Time from capturing a segment's audio until it is part of a published figure
+        now = time.time()
+        for segment in segments:
+            registry.observe('live_end_to_end_latency_seconds', now - segment.created,
+                             help_text="Time from audio capture to published figure", session=self.name)
+        if segments:
+            self.last_rendered_conversation_id = conversation_id
+            self.last_rendered_segment_id = segments[-1].id
+            if self.on_rendered is not None:
+                self.on_rendered(segments, now)
+
+    def _publish(self, figure):
+        # go.Figure in thread mode, already a dict when coming from the worker process
+        if hasattr(figure, 'to_dict'):
+            figure = figure.to_dict()
+        with self.condition:
+            self.version += 1
+            self.data = figure
+            # Keep a few recent versions so zooming can work on the figure a client currently shows
+            self.history[self.version] = figure
+            if len(self.history) > self.history_size:
+                self.history.popitem(last=False)
+            self.condition.notify_all()
+
+    def wait_for_update(self, known_version, timeout=None):
+        # Blocks until a figure newer than known_version exists or the timeout expires
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != known_version, timeout)
+            return self.version
 
     def get_data(self):
         return self.data
+
+    def get_latest(self):
+        with self.condition:
+            return self.version, self.data
+
+    def get_version_data(self, version):
+        with self.condition:
+            return self.history.get(version)
+
+    def get_metrics(self):
+        metrics = {
+            'pending_tasks': self.queue.qsize(),
+            'processed_tasks': self.processed_tasks,
+            'dropped_tasks': self.dropped_tasks,
+        }
+        if self.worker is not None:
+            metrics.update(self.worker.get_metrics(self.name))
+            metrics['worker_restarts'] = self.worker.restarts
+            metrics['worker_timed_out_tasks'] = self.worker.timed_out_tasks
+        else:
+            metrics.update(self.builder.get_metrics())
+        return metrics
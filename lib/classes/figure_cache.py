@@ -0,0 +1,55 @@
+import gzip
+import json
+from collections import OrderedDict
+from threading import Lock
+
+from plotly.utils import PlotlyJSONEncoder
+
+
+class FigureCache:
+    def __init__(self, max_entries=4, compression_level=6):
+        # version -> (json bytes, gzipped json bytes)
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.compression_level = compression_level
+        self.lock = Lock()
+        self.serializations = 0
+        self.hits = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.uncompressed_bytes_sent = 0
+
+    def get(self, version, figure):
+        # Serializes and compresses each figure version once, no matter how often it is requested
+        with self.lock:
+            if version in self.entries:
+                self.hits += 1
+                return self.entries[version]
+
+        raw = json.dumps(figure, cls=PlotlyJSONEncoder).encode('utf-8')
+        compressed = gzip.compress(raw, compresslevel=self.compression_level)
+        with self.lock:
+            self.serializations += 1
+            self.entries[version] = (raw, compressed)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return raw, compressed
+
+    def record_sent(self, sent_bytes, uncompressed_bytes=None):
+        with self.lock:
+            self.bytes_sent += sent_bytes
+            self.uncompressed_bytes_sent += uncompressed_bytes if uncompressed_bytes is not None else sent_bytes
+
+    def record_not_modified(self):
+        with self.lock:
+            self.not_modified += 1
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'figure_serializations': self.serializations,
+                'figure_cache_hits': self.hits,
+                'figure_not_modified': self.not_modified,
+                'figure_bytes_sent': self.bytes_sent,
+                'figure_uncompressed_bytes_sent': self.uncompressed_bytes_sent,
+            }
@@ -0,0 +1,131 @@
+import networkx as nx
+
+from lib.classes.layout_cache import graph_fingerprint
+from lib.mapper import aggregate_links, select_edges, get_neighborhood_positions, layout_from_neighborhoods, \
+    warm_start_layout
+
+
+class GraphModel:
+    def __init__(self, top_count=100, stable_layout=True, layout_threshold=1e-3, layout='spring', layout_cache=None,
+                 level_sizes=None):
+        # Keeps the mind map graph between live updates. Each update diffs the new top edges
+        # against the graph and only adds, reweights or drops what changed. Neighborhood seed
+        # layouts are kept per node and only recomputed for nodes whose edges changed, and only
+        # once a layout from scratch is due (the first one, or every one without stable_layout).
+        # With stable_layout, each layout continues from the previous one so the map doesn't jump.
+        # An optional lib.classes.layout_cache.LayoutCache skips the layout for graphs seen before.
+        # level_sizes switches from the top_count edges to nested detail levels, see lib.mapper.select_edges.
+        self.top_count = top_count
+        self.level_sizes = level_sizes
+        self.stable_layout = stable_layout
+        self.layout_threshold = layout_threshold
+        # 'spring', 'barnes_hut' or 'community', see lib.mapper.create_mind_map_force
+        self.layout_engine = layout
+        self.layout_cache = layout_cache
+        self.G = nx.Graph()
+        self.neighborhood_positions = {}
+        # Nodes whose edges changed since their seed layout was computed
+        self.stale_neighborhoods = set()
+        self.positions = {}
+        self.added_edges = 0
+        self.reweighted_edges = 0
+        self.dropped_edges = 0
+        self.recomputed_neighborhoods = 0
+
+    def reset(self):
+        self.G = nx.Graph()
+        self.neighborhood_positions = {}
+        self.stale_neighborhoods = set()
+        self.positions = {}
+
+    def update(self, proximity_links):
+        # proximity_links is the full link list of the current text
+        edge_weights, node_categories, degrees = aggregate_links(proximity_links)
+
+        # Wanted undirected edges; like Graph.add_edge, a later (b, a) overwrites the weight of (a, b)
+        # but it stays on the level of (a, b)
+        wanted = {}
+        for (source, target), weight, level in select_edges(edge_weights, self.top_count, self.level_sizes):
+            key = frozenset((source, target))
+            if key in wanted:
+                source, target, _, level = wanted[key]
+            wanted[key] = (source, target, weight, level)
+
+        affected = set()
+        for source, target in list(self.G.edges):
+            if frozenset((source, target)) not in wanted:
+                self.G.remove_edge(source, target)
+                affected.update((source, target))
+                self.dropped_edges += 1
+
+        for source, target, weight, level in wanted.values():
+            if self.G.has_edge(source, target):
+                self.G.edges[source, target]['level'] = level
+                if self.G.edges[source, target]['weight'] != weight:
+                    self.G.edges[source, target]['weight'] = weight
+                    self.reweighted_edges += 1
+                continue
+            self.G.add_edge(source, target, weight=weight, level=level)
+            affected.update((source, target))
+            self.added_edges += 1
+
+        # Nodes are only in the graph for their edges
+        for node in [node for node in self.G.nodes if self.G.degree[node] == 0]:
+            self.G.remove_node(node)
+            self.neighborhood_positions.pop(node, None)
+            self.stale_neighborhoods.discard(node)
+            affected.discard(node)
+
+        # Sizes, categories and levels can change without the node's edges changing
+        for node, attributes in self.G.nodes.items():
+            attributes['category'] = node_categories[node]
+            attributes['size'] = degrees[node]
+            attributes['level'] = min(level for _, _, level in self.G.edges(node, data='level'))
+
+        if self.layout_engine == 'spring':
+            # Only used by the spring layout, see lib.mapper.create_mind_map_force
+            self.stale_neighborhoods.update(affected)
+        return self.G
+
+    def _update_neighborhoods(self):
+        for node in self.stale_neighborhoods:
+            positions = get_neighborhood_positions(self.G, node)
+            if positions is None:
+                self.neighborhood_positions.pop(node, None)
+            else:
+                self.neighborhood_positions[node] = positions
+        self.recomputed_neighborhoods += len(self.stale_neighborhoods)
+        self.stale_neighborhoods = set()
+
+    def layout(self):
+        if self.layout_cache is not None:
+            key = graph_fingerprint(self.G, self.layout_engine)
+            positions = self.layout_cache.get(key)
+            if positions is not None:
+                self.positions = positions
+                return self.positions
+
+        if self.stable_layout and self.positions:
+            self.positions = warm_start_layout(self.G, self.positions, threshold=self.layout_threshold,
+                                               layout=self.layout_engine)
+        else:
+            self._update_neighborhoods()
+            self.positions = layout_from_neighborhoods(self.G, self.neighborhood_positions, self.layout_engine)
+            if self.stable_layout:
+                # Settled under the warm start's forces right away, or the next frame would do it
+                self.positions = warm_start_layout(self.G, self.positions, threshold=self.layout_threshold,
+                                                   layout=self.layout_engine)
+        if self.layout_cache is not None and self.positions:
+            self.layout_cache.put(key, self.positions)
+        return self.positions
+
+    def get_metrics(self):
+        return {
+            'graph_nodes': self.G.number_of_nodes(),
+            'graph_edges': self.G.number_of_edges(),
+            'graph_added_edges': self.added_edges,
+            'graph_reweighted_edges': self.reweighted_edges,
+            'graph_dropped_edges': self.dropped_edges,
+            'graph_recomputed_neighborhoods': self.recomputed_neighborhoods,
+            **(self.layout_cache.get_metrics() if self.layout_cache is not None else {}),
+        }
@@ -0,0 +1,95 @@
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from threading import Lock
+
+import numpy as np
+import speech_recognition as sr
+
+from lib.classes.metrics import registry
+from lib.classes.recognizers import Recognizer, Hypothesis
+
+
+class HedgedRecognizer(Recognizer):
+    def __init__(self, recognizer, deadline=8, max_retries=2, backoff=.5, hedge_percentile=95, hedge_min_samples=20,
+                 latency_window=200, max_workers=16, name='default'):
+        # Wraps a recognizer so one slow or hung request can't stall the transcript:
+        # - every attempt gets a deadline, after which it is abandoned
+        # - failed or timed out attempts are retried with exponential backoff and jitter
+        # - once enough latencies are known, an attempt still running after the hedge_percentile
+        #   latency gets a duplicate request, and whichever answers first wins
+        # Only final hypotheses are passed on, partials of racing attempts would interleave.
+        self.recognizer = recognizer
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = deque(maxlen=latency_window)
+        # Abandoned attempts keep a worker busy until they return, so this is generous
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='recognition-attempt')
+        self.lock = Lock()
+        self.name = name
+
+    def _attempt(self, audio, language):
+        start = time.perf_counter()
+        text = self.recognizer.recognize(audio, language)
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+        return text
+
+    def _get_hedge_delay(self):
+        with self.lock:
+            if len(self.latencies) < self.hedge_min_samples:
+                return None
+            return float(np.percentile(self.latencies, self.hedge_percentile))
+
+    def _count(self, event):
+        registry.inc('live_recognition_events_total', help_text="Recognition retries, hedges, timeouts and failures",
+                     session=self.name, event=event)
+
+    def _run_attempt(self, audio, language):
+        # Returns (finished, text); finished is False if the deadline passed or every request failed
+        start = time.monotonic()
+        hedge_delay = self._get_hedge_delay()
+        futures = {self.executor.submit(self._attempt, audio, language)}
+        hedged = False
+        error = None
+        while futures:
+            elapsed = time.monotonic() - start
+            remaining = self.deadline - elapsed
+            if remaining <= 0:
+                self._count('deadline_exceeded')
+                return False, None
+            timeout = remaining
+            if not hedged and hedge_delay is not None:
+                timeout = max(min(remaining, hedge_delay - elapsed), 0)
+
+            done, futures = wait(futures, timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return True, future.result()
+                except sr.RequestError as e:
+                    error = e
+                    self._count('request_failed')
+
+            if not hedged and hedge_delay is not None and futures and time.monotonic() - start >= hedge_delay:
+                hedged = True
+                self._count('hedged')
+                futures.add(self.executor.submit(self._attempt, audio, language))
+
+        print(f"Recognition request failed: {error}")
+        return False, None
+
+    def stream(self, audio, language):
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self._count('retried')
+                time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(.5, 1.5))
+            finished, text = self._run_attempt(audio, language)
+            if finished:
+                if text:
+                    yield Hypothesis(text, True)
+                return
+        raise sr.RequestError(f"recognition failed after {self.max_retries + 1} attempts")
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+def graph_fingerprint(G, layout='spring'):
+    # Canonical hash of what a layout depends on: the node set, the weighted edges and the layout
+    # engine. Independent of insertion order and edge direction.
+    nodes = sorted(repr(node) for node in G.nodes)
+    edges = sorted(tuple(sorted((repr(source), repr(target)))) + (repr(weight),)
+                   for source, target, weight in G.edges(data='weight', default=1))
+    content = json.dumps([layout, nodes, edges])
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class LayoutCache:
+    def __init__(self, max_entries=64, folder=None, max_files=None):
+        # fingerprint -> {node: position}, least recently used first. With a folder, layouts are
+        # also written to disk so later runs (e.g. re-running plotter.py) can reuse them; beyond
+        # max_files the least recently written files are deleted.
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.folder = folder
+        self.max_files = max_files
+        self.lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if folder is not None and not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def _get_path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return dict(self.entries[key])
+
+        if self.folder is not None and os.path.exists(self._get_path(key)):
+            with open(self._get_path(key), 'r', encoding='utf-8') as f:
+                # Stored as [node, x, y] rows, JSON object keys would turn every node into a string
+                positions = {node: np.array([x, y]) for node, x, y in json.load(f)}
+            with self.lock:
+                self.disk_hits += 1
+                self._put(key, positions)
+            return dict(positions)
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, positions):
+        with self.lock:
+            self._put(key, dict(positions))
+        if self.folder is not None:
+            rows = [[node, float(position[0]), float(position[1])] for node, position in positions.items()]
+            with open(self._get_path(key), 'w', encoding='utf-8') as f:
+                json.dump(rows, f)
+            if self.max_files is not None:
+                self._prune_files()
+
+    def _prune_files(self):
+        paths = [os.path.join(self.folder, name) for name in os.listdir(self.folder) if name.endswith('.json')]
+        if len(paths) <= self.max_files:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_files]:
+            os.remove(path)
+
+    def _put(self, key, positions):
+        self.entries[key] = positions
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'layout_cache_size': len(self.entries),
+                'layout_cache_hits': self.hits,
+                'layout_cache_disk_hits': self.disk_hits,
+                'layout_cache_misses': self.misses,
+            }
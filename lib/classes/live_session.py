@@ -0,0 +1,87 @@
+import itertools
+import time
+from datetime import datetime
+from threading import Lock
+
+from lib.classes.figure_cache import FigureCache
+from lib.classes.transcript import Transcript
+from lib.classes.transcript_writer import TranscriptWriter
+
+
+conversation_counter = itertools.count(1)
+
+
+def new_conversation_id():
+    # Timestamp for the transcript file name, plus a counter so a reset within the same second
+    # still starts a new conversation (and file) instead of continuing the old one
+    return f"{datetime.now().strftime('%Y-%m-%d-%H_%M_%S')}_{next(conversation_counter)}"
+
+
+class LiveSession:
+    def __init__(self, session_id, selected_lang, processor,
+                 transcript_folder="transcripts/", latest_transcript_file=None):
+        self.session_id = session_id
+        self.selected_lang = selected_lang
+        self.processor = processor
+        self.figure_cache = FigureCache()
+        self.transcript_folder = transcript_folder
+        self.latest_transcript_file = latest_transcript_file
+        self.lock = Lock()
+        self.transcript = Transcript()
+        self.conversation_id = new_conversation_id()
+        self.transcript_file = self._get_transcript_file()
+        self.writer = TranscriptWriter(self._get_transcript_paths())
+        self.last_active = time.monotonic()
+        self.pinned = False
+
+    def _get_transcript_file(self):
+        return f"{self.transcript_folder}transcript_{self.session_id}_{self.conversation_id}.txt"
+
+    def _get_transcript_paths(self):
+        if self.latest_transcript_file is None:
+            return [self.transcript_file]
+        return [self.transcript_file, self.latest_transcript_file]
+
+    def add_text(self, text, captured_at=None):
+        with self.lock:
+            self.last_active = time.monotonic()
+            segment = self.transcript.append(text, captured_at)
+            self.writer.write(text, segment.id)
+            # Tasks only carry the new segment, the processor keeps the rest
+            self.processor.add_task(([segment], self.selected_lang, self.conversation_id, len(self.transcript), None))
+            return len(self.transcript)
+
+    def set_partial(self, text):
+        # Shows not yet final text on the map. It isn't written to the transcript and is
+        # replaced by the next partial or final text.
+        with self.lock:
+            self.last_active = time.monotonic()
+            self.processor.add_task(([], self.selected_lang, self.conversation_id, len(self.transcript), text + " "))
+
+    def toggle_language(self, languages):
+        with self.lock:
+            self.selected_lang = languages[1] if self.selected_lang == languages[0] else languages[0]
+            return self.selected_lang
+
+    def reset(self):
+        with self.lock:
+            self.transcript = Transcript()
+            self.conversation_id = new_conversation_id()
+            self.transcript_file = self._get_transcript_file()
+            self.writer.rotate(self._get_transcript_paths(), truncate_paths=[self.latest_transcript_file])
+
+    def get_freshness(self):
+        # Age of the oldest segment that has not made it into a figure yet, 0 if all have.
+        # Under the lock so a concurrent reset() can't swap the transcript between the reads
+        with self.lock:
+            rendered_id = -1
+            if self.processor.last_rendered_conversation_id == self.conversation_id:
+                rendered_id = self.processor.last_rendered_segment_id
+            last_segment = self.transcript.get_last()
+            if last_segment is None or last_segment.id <= rendered_id:
+                return 0
+            return time.time() - self.transcript.get(rendered_id + 1).created
+
+    def close(self):
+        self.processor.stop()
+        self.writer.close()
@@ -0,0 +1,115 @@
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from deepmultilingualpunctuation import PunctuationModel
+
+from lib.advanced_text_processing import extract_logical_links_advanced, get_preprocessed_sentences
+from lib.classes.graph_model import GraphModel
+from lib.classes.layout_cache import LayoutCache
+from lib.plotly_wrapper import create_plot
+
+
+class MapBuilder:
+    def __init__(self, link_cache_size=2048, punctuation_model=None, punctuation_lock=None, max_text_length=None,
+                 level_sizes=None):
+        # Sessions can share one loaded model, calls into it are serialized by the shared lock
+        self.punctuation_model = punctuation_model if punctuation_model is not None else PunctuationModel()
+        self.punctuation_lock = punctuation_lock if punctuation_lock is not None else Lock()
+        self.link_cache = OrderedDict()
+        self.link_cache_size = link_cache_size
+        self.link_cache_hits = 0
+        self.link_cache_misses = 0
+        # Segments of the current conversation, filled from the deltas carried by each task
+        self.conversation_id = None
+        self.segments = []
+        self.last_segment_id = -1
+        self.text_length = 0
+        self.max_text_length = max_text_length
+        # The graph persists between builds, each build only applies what changed
+        # Frames often repeat a graph (e.g. a partial result followed by the same final text)
+        self.graph_model = GraphModel(layout_cache=LayoutCache(), level_sizes=level_sizes)
+        # Seconds spent in each stage by the last build
+        self.stage_timings = {}
+
+    def apply_segments(self, segments, conversation_id):
+        if conversation_id != self.conversation_id:
+            self.conversation_id = conversation_id
+            self.segments = []
+            self.last_segment_id = -1
+            self.text_length = 0
+            self.graph_model.reset()
+
+        for segment in segments:
+            # Segments may be sent again (e.g. after a worker restart), skip the known ones
+            if segment.id <= self.last_segment_id:
+                continue
+            self.segments.append(segment)
+            self.last_segment_id = segment.id
+            self.text_length += len(segment.text)
+
+        if self.max_text_length is not None:
+            # Per-session limit: only the most recent segments are mapped
+            while len(self.segments) > 1 and self.text_length > self.max_text_length:
+                self.text_length -= len(self.segments.pop(0).text)
+
+    def build(self, task):
+        segments, selected_lang, conversation_id, n, partial_text = task
+        self.apply_segments(segments, conversation_id)
+        text = "".join(segment.text for segment in self.segments)
+        if partial_text:
+            # Tentative text of the utterance being recognized, replaced once it is final
+            text += partial_text
+        self.stage_timings = {}
+
+        start = time.perf_counter()
+        with self.punctuation_lock:
+            text = self.punctuation_model.restore_punctuation(text)
+        self.stage_timings['punctuation'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sentences = get_preprocessed_sentences(text)
+        logical_links = []
+        for i in range(len(sentences) - 1):
+            logical_links.extend(self._get_pair_links(sentences[i], sentences[i + 1], selected_lang))
+        self.stage_timings['cooccurrence'] = time.perf_counter() - start
+
+        print(f"Task {n} - Logical links: {len(logical_links)}")
+        start = time.perf_counter()
+        G = self.graph_model.update(logical_links)
+        self.stage_timings['graph'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        positions = self.graph_model.layout()
+        self.stage_timings['layout'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        figure = create_plot(G, positions, True, title=f"Transcript: {conversation_id} ({len(text)} characters - task {n})")
+        self.stage_timings['figure_build'] = time.perf_counter() - start
+        return figure
+
+    def _get_pair_links(self, first_sentence, second_sentence, selected_lang):
+        # Links only depend on the content of the sentence pair, so the cache is keyed by
+        # a hash of that content instead of the sentence index, which shifts with punctuation.
+        key = hashlib.sha1(f"{selected_lang}\0{first_sentence}\0{second_sentence}".encode('utf-8')).hexdigest()
+        if key in self.link_cache:
+            self.link_cache.move_to_end(key)
+            self.link_cache_hits += 1
+            return self.link_cache[key]
+
+        self.link_cache_misses += 1
+        links = extract_logical_links_advanced(first_sentence + second_sentence, selected_lang, True)
+        self.link_cache[key] = links
+        if len(self.link_cache) > self.link_cache_size:
+            self.link_cache.popitem(last=False)
+        return links
+
+    def get_metrics(self):
+        return {
+            'link_cache_size': len(self.link_cache),
+            'link_cache_hits': self.link_cache_hits,
+            'link_cache_misses': self.link_cache_misses,
+            **self.graph_model.get_metrics(),
+            'stage_timings': self.stage_timings,
+        }
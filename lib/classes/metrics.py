@@ -0,0 +1,90 @@
+import bisect
+from threading import Lock
+
+default_buckets = [.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60]
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for key, value in labels]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = Lock()
+        # name -> (type, help text, {label tuple -> value or Histogram})
+        self.metrics = {}
+
+    def _get_series(self, name, metric_type, help_text):
+        if name not in self.metrics:
+            self.metrics[name] = (metric_type, help_text, {})
+        return self.metrics[name][2]
+
+    def observe(self, name, value, help_text="", buckets=None, **labels):
+        with self.lock:
+            series = self._get_series(name, 'histogram', help_text)
+            key = tuple(sorted(labels.items()))
+            if key not in series:
+                series[key] = Histogram(buckets or default_buckets)
+            series[key].observe(value)
+
+    def inc(self, name, amount=1, help_text="", **labels):
+        with self.lock:
+            series = self._get_series(name, 'counter', help_text)
+            key = tuple(sorted(labels.items()))
+            series[key] = series.get(key, 0) + amount
+
+    def set(self, name, value, help_text="", **labels):
+        with self.lock:
+            series = self._get_series(name, 'gauge', help_text)
+            series[tuple(sorted(labels.items()))] = value
+
+    def remove(self, **labels):
+        # Drops every series carrying these labels, e.g. when a session is closed
+        with self.lock:
+            for metric_type, help_text, series in self.metrics.values():
+                for key in list(series.keys()):
+                    if all(item in key for item in labels.items()):
+                        del series[key]
+
+    def render(self):
+        # Prometheus text exposition format
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text, series) in self.metrics.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for key, value in series.items():
+                    if metric_type != 'histogram':
+                        lines.append(f"{name}{format_labels(key)} {value}")
+                        continue
+                    cumulative = 0
+                    for bucket, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(key + (('le', bucket),))} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(key + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {value.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every session in this process
+registry = MetricsRegistry()
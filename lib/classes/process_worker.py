@@ -0,0 +1,156 @@
+import multiprocessing
+import queue
+import time
+from threading import Lock
+
+from deepmultilingualpunctuation import PunctuationModel
+
+from lib.classes.map_builder import MapBuilder
+
+
+def _worker_main(task_queue, result_queue, link_cache_size, max_text_length, level_sizes):
+    # Runs in the child process: the punctuation model, link caches and segments live here,
+    # so none of the heavy work competes with the Dash server for the GIL.
+    # One builder per session, all sharing the one loaded punctuation model.
+    punctuation_model = PunctuationModel()
+    punctuation_lock = Lock()
+    builders = {}
+    while True:
+        message = task_queue.get()
+        if message is None:
+            break
+        command, key, task = message
+        if command == 'close':
+            builders.pop(key, None)
+            continue
+
+        if key not in builders:
+            builders[key] = MapBuilder(link_cache_size, punctuation_model, punctuation_lock,
+                                       max_text_length=max_text_length, level_sizes=level_sizes)
+        builder = builders[key]
+        try:
+            figure = builder.build(task)
+            # Plain dicts pickle much faster than go.Figure and Dash accepts them as-is
+            result_queue.put((task[3], figure.to_dict(), builder.get_metrics(), None))
+        except Exception as e:
+            result_queue.put((task[3], None, builder.get_metrics(), repr(e)))
+
+
+class WorkerTaskError(RuntimeError):
+    # The child crashed or hung on this task and was restarted; the task is given up
+    pass
+
+
+class ProcessWorker:
+    def __init__(self, link_cache_size=2048, max_restarts=5, max_text_length=None, level_sizes=None,
+                 task_timeout=60):
+        # One child process can serve many sessions: tasks are sent with a key (the session name)
+        # and run one at a time, so all sessions share a single copy of the models.
+        # A task that crashes or hangs the child is given up and the child restarted. Failures are
+        # counted per key: after max_restarts failed tasks in a row, that key's tasks are skipped
+        # while the other keys carry on. A successful task resets its key's count.
+        # spawn is the only start method on Windows; use it everywhere so behaviour matches
+        self.context = multiprocessing.get_context('spawn')
+        self.link_cache_size = link_cache_size
+        self.max_text_length = max_text_length
+        self.level_sizes = level_sizes
+        self.max_restarts = max_restarts
+        # A child that takes longer than this for one task is considered hung and restarted
+        self.task_timeout = task_timeout
+        self.restarts = 0
+        self.timed_out_tasks = 0
+        # key -> failed tasks in a row
+        self.key_failures = {}
+        # Keys the current child has been sent segments for; a restarted child has lost them all
+        self.known_keys = set()
+        self.lock = Lock()
+        self.process = None
+        self.task_queue = None
+        self.result_queue = None
+        # key -> metrics of that key's last build
+        self.metrics = {}
+
+    def start(self):
+        self.task_queue = self.context.Queue()
+        self.result_queue = self.context.Queue()
+        self.process = self.context.Process(target=_worker_main,
+                                            args=(self.task_queue, self.result_queue, self.link_cache_size,
+                                                  self.max_text_length, self.level_sizes),
+                                            daemon=True)
+        self.process.start()
+        self.known_keys = set()
+        print(f"Worker process started (pid {self.process.pid})")
+
+    def stop(self, timeout=5):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            self.task_queue.put(None)
+            self.process.join(timeout)
+        if self.process.is_alive():
+            print("Worker process did not stop in time, terminating...")
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+
+    def restart(self):
+        self.restarts += 1
+        print(f"Restarting worker process (restart {self.restarts})...")
+        self.stop(timeout=0)
+        self.start()
+
+    def _fail(self, key, task, reason):
+        # Restarts the child and gives the task up instead of sending it again
+        self.key_failures[key] = self.key_failures.get(key, 0) + 1
+        print(f"Task {task[3]} - {reason} ({key}: {self.key_failures[key]}/{self.max_restarts} failed tasks in a row)")
+        self.restart()
+        raise WorkerTaskError(reason)
+
+    def forget(self, key):
+        # Drops a closed session's segments and caches in the child
+        with self.lock:
+            self.known_keys.discard(key)
+            self.metrics.pop(key, None)
+            self.key_failures.pop(key, None)
+            if self.process is not None:
+                self.task_queue.put(('close', key, None))
+
+    def get_metrics(self, key):
+        with self.lock:
+            return self.metrics.get(key, {})
+
+    def _send(self, key, task, get_full_task):
+        if key not in self.known_keys and get_full_task is not None:
+            task = get_full_task()
+        self.known_keys.add(key)
+        self.task_queue.put(('build', key, task))
+
+    def run(self, task, get_full_task=None, key='default', poll_interval=.5):
+        # Sends one task and waits for its figure. The first task for a key after the child (re)started
+        # is replaced by get_full_task(), which carries every segment of the key's conversation.
+        # If the child dies or hangs past task_timeout, it is restarted and WorkerTaskError raised:
+        # the caller has to leave the task's segments out of get_full_task() from then on, or the
+        # fresh child would be sent them again.
+        with self.lock:
+            if self.key_failures.get(key, 0) >= self.max_restarts:
+                raise RuntimeError(f"Worker process skips {key} after {self.max_restarts} failed tasks in a row")
+            if self.process is None:
+                self.start()
+            self._send(key, task, get_full_task)
+            deadline = time.monotonic() + self.task_timeout
+            while True:
+                try:
+                    n, figure, metrics, error = self.result_queue.get(timeout=poll_interval)
+                except queue.Empty:
+                    if not self.process.is_alive():
+                        self._fail(key, task, f"Worker process died (exit code {self.process.exitcode})")
+                    elif time.monotonic() > deadline:
+                        self.timed_out_tasks += 1
+                        self._fail(key, task, f"Worker process hung for {self.task_timeout}s")
+                    continue
+
+                self.key_failures.pop(key, None)
+                self.metrics[key] = metrics
+                if error is not None:
+                    print(f"Task {n} - Worker process failed: {error}")
+                return figure
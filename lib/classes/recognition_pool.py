@@ -0,0 +1,134 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Condition, RLock, Timer
+
+from lib.classes.reorder_buffer import ReorderBuffer
+
+
+class RecognitionPool:
+    def __init__(self, recognize, on_result, workers=4, timeout=30, max_pending=None, on_partial=None):
+        # recognize(audio) is blocking and returns the text or None, or an iterable of Hypothesis for
+        # streaming recognizers. on_result(text, captured_at) is called in capture order, no matter in
+        # which order recognitions finish. on_partial(text) receives partial hypotheses, but only those
+        # of the utterance whose final text is released next, so tentative text stays in order too.
+        self.recognize = recognize
+        self.on_result = on_result
+        self.on_partial = on_partial
+        self.workers = workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='recognition')
+        # submit() blocks once this many utterances are in flight
+        self.slots = BoundedSemaphore(max_pending or workers * 2)
+        self.lock = RLock()
+        # Notified whenever the last utterance in flight completes
+        self.idle = Condition(self.lock)
+        self.buffer = ReorderBuffer()
+        self.next_sequence = 0
+        self.in_flight = set()
+        # Results from before the last reset are discarded
+        self.generation = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.failed = 0
+
+    def submit(self, audio, captured_at=None):
+        self.slots.acquire()
+        with self.lock:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            generation = self.generation
+            self.in_flight.add(sequence)
+        if captured_at is None:
+            captured_at = time.time()
+
+        # Started by the worker, so time spent queued behind other utterances doesn't count
+        timer = Timer(self.timeout, self._complete, args=(generation, sequence, None, captured_at, True))
+        timer.daemon = True
+        future = self.executor.submit(self._recognize, audio, generation, sequence, timer)
+        future.add_done_callback(lambda f: self._on_done(f, generation, sequence, captured_at, timer))
+        return sequence
+
+    def _recognize(self, audio, generation, sequence, timer):
+        timer.start()
+        result = self.recognize(audio)
+        if result is None or isinstance(result, str):
+            return result
+
+        text = None
+        for hypothesis in result:
+            if hypothesis.final:
+                text = hypothesis.text
+            else:
+                self._partial(generation, sequence, hypothesis.text)
+        return text
+
+    def _partial(self, generation, sequence, text):
+        with self.lock:
+            if self.on_partial is None or generation != self.generation or sequence not in self.in_flight:
+                return
+            if sequence == self.buffer.next_sequence:
+                self.on_partial(text)
+
+    def _on_done(self, future, generation, sequence, captured_at, timer):
+        timer.cancel()
+        try:
+            text = future.result()
+        except Exception as e:
+            print(f"Segment {sequence} - Recognition failed: {e}")
+            with self.lock:
+                self.failed += 1
+            text = None
+        self._complete(generation, sequence, text, captured_at, False)
+
+    def _complete(self, generation, sequence, text, captured_at, timed_out):
+        with self.lock:
+            if generation != self.generation or sequence not in self.in_flight:
+                # Reset in between, or the other of result/timeout got here first
+                return
+            self.in_flight.discard(sequence)
+            self.slots.release()
+            if timed_out:
+                print(f"Segment {sequence} - Recognition timed out after {self.timeout}s, skipping it")
+                self.timed_out += 1
+            else:
+                self.completed += 1
+
+            # Delivered while holding the lock so that batches released by different
+            # threads can't overtake each other
+            for _, (released_text, released_captured_at) in self.buffer.push(sequence, (text, captured_at)):
+                if released_text:
+                    self.on_result(released_text, released_captured_at)
+            if not self.in_flight:
+                self.idle.notify_all()
+
+    def wait(self, timeout=None):
+        # Blocks until every submitted utterance is delivered or skipped, returns False on timeout
+        with self.lock:
+            return self.idle.wait_for(lambda: not self.in_flight, timeout)
+
+    def reset(self):
+        with self.lock:
+            self.generation += 1
+            for _ in self.in_flight:
+                self.slots.release()
+            self.in_flight = set()
+            self.buffer.reset(self.next_sequence)
+            self.idle.notify_all()
+
+    def shutdown(self, timeout=None):
+        # Delivers the utterances still in flight, waiting at most timeout (by default the
+        # recognition timeout), and only then drops what is left
+        if not self.wait(self.timeout if timeout is None else timeout):
+            print(f"Recognition pool - {len(self.in_flight)} utterances still in flight at shutdown, dropping them")
+        self.reset()
+        self.executor.shutdown(wait=False)
+
+    def get_metrics(self):
+        with self.lock:
+            return {
+                'recognition_in_flight': len(self.in_flight),
+                'recognition_waiting_for_order': len(self.buffer),
+                'recognition_completed': self.completed,
+                'recognition_timed_out': self.timed_out,
+                'recognition_failed': self.failed,
+            }
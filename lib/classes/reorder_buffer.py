@@ -0,0 +1,24 @@
+class ReorderBuffer:
+    def __init__(self, next_sequence=0):
+        self.next_sequence = next_sequence
+        self.pending = {}
+
+    def push(self, sequence, item):
+        # Returns the (sequence, item) pairs that can be released in order now.
+        # Items for sequences that were already released or pushed are ignored.
+        if sequence < self.next_sequence or sequence in self.pending:
+            return []
+        self.pending[sequence] = item
+
+        released = []
+        while self.next_sequence in self.pending:
+            released.append((self.next_sequence, self.pending.pop(self.next_sequence)))
+            self.next_sequence += 1
+        return released
+
+    def reset(self, next_sequence=0):
+        self.next_sequence = next_sequence
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.pending)
@@ -0,0 +1,114 @@
+import re
+import time
+from threading import Lock
+
+from deepmultilingualpunctuation import PunctuationModel
+
+from lib.classes.background_processor import BackgroundProcessor
+from lib.classes.live_session import LiveSession
+from lib.classes.metrics import registry
+from lib.classes.process_worker import ProcessWorker
+
+session_id_pattern = re.compile(r'^[\w-]{1,64}$')
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class SessionManager:
+    def __init__(self, default_lang='de', max_sessions=32, max_text_length=200000, idle_timeout=3600,
+                 link_cache_size=2048, use_worker_process=False, level_sizes=None):
+        self.default_lang = default_lang
+        self.max_sessions = max_sessions
+        self.max_text_length = max_text_length
+        self.idle_timeout = idle_timeout
+        self.link_cache_size = link_cache_size
+        self.use_worker_process = use_worker_process
+        # Nodes per detail level of the maps, None for the top 100 edges without levels
+        self.level_sizes = level_sizes
+        self.sessions = {}
+        self.lock = Lock()
+        # Loaded once and shared by every session: in this process, or with use_worker_process
+        # in one worker process serving all sessions. Word category caches are module level
+        # and therefore shared as well.
+        self.punctuation_model = None
+        self.worker = None
+        if use_worker_process:
+            self.worker = ProcessWorker(link_cache_size, max_text_length=max_text_length, level_sizes=level_sizes)
+            self.worker.start()
+        else:
+            self.punctuation_model = PunctuationModel()
+        self.punctuation_lock = Lock()
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def get_or_create(self, session_id, latest_transcript_file=None, pinned=False):
+        if not session_id_pattern.match(session_id):
+            raise ValueError(f"Invalid session id '{session_id}'")
+
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session.last_active = time.monotonic()
+                return session
+
+            if len(self.sessions) >= self.max_sessions:
+                self._close_idle_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                raise SessionLimitError(f"Session limit of {self.max_sessions} reached")
+
+            processor = BackgroundProcessor(self.link_cache_size,
+                                            punctuation_model=self.punctuation_model,
+                                            punctuation_lock=self.punctuation_lock,
+                                            max_text_length=self.max_text_length,
+                                            name=session_id,
+                                            level_sizes=self.level_sizes,
+                                            worker=self.worker)
+            session = LiveSession(session_id, self.default_lang, processor,
+                                  latest_transcript_file=latest_transcript_file)
+            # Pinned sessions (the local microphone) are never closed for being idle
+            session.pinned = pinned
+            self.sessions[session_id] = session
+            print(f"Session {session_id} - Created ({len(self.sessions)}/{self.max_sessions} sessions)")
+            return session
+
+    def _close_idle_sessions(self):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            if not session.pinned and now - session.last_active > self.idle_timeout:
+                print(f"Session {session_id} - Closing after {int(now - session.last_active)}s idle")
+                session.close()
+                registry.remove(session=session_id)
+                del self.sessions[session_id]
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+            registry.remove(session=session_id)
+
+    def close_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+        if self.worker is not None:
+            self.worker.stop()
+
+    def update_metrics(self):
+        # Gauges are sampled when metrics are scraped
+        with self.lock:
+            sessions = list(self.sessions.values())
+        registry.set('live_sessions', len(sessions), help_text="Open live sessions")
+        for session in sessions:
+            registry.set('live_queue_depth', session.processor.queue.qsize(),
+                         help_text="Tasks waiting for the processor", session=session.session_id)
+            registry.set('live_freshness_seconds', session.get_freshness(),
+                         help_text="Age of the oldest segment not yet shown in a figure", session=session.session_id)
+            registry.set('live_figure_bytes_sent', session.figure_cache.bytes_sent,
+                         help_text="Figure payload bytes sent to clients", session=session.session_id)
@@ -0,0 +1,34 @@
+import time
+from collections import namedtuple
+from threading import Lock
+
+# offset is the position of the segment's first character in the full transcript,
+# created is the wall clock time its audio was captured (used for freshness metrics)
+Segment = namedtuple('Segment', ['id', 'offset', 'text', 'created'])
+
+
+class Transcript:
+    def __init__(self):
+        self.segments = []
+        self.length = 0
+        self.lock = Lock()
+
+    def append(self, text, created=None):
+        # Segments are never modified after being appended, so they can be handed
+        # to other threads and processes without copying the rest of the transcript.
+        with self.lock:
+            segment = Segment(len(self.segments), self.length, text, created if created is not None else time.time())
+            self.segments.append(segment)
+            self.length += len(text)
+            return segment
+
+    def get(self, segment_id):
+        with self.lock:
+            return self.segments[segment_id]
+
+    def get_last(self):
+        with self.lock:
+            return self.segments[-1] if self.segments else None
+
+    def __len__(self):
+        return len(self.segments)
@@ -0,0 +1,112 @@
+import os
+import time
+from queue import Queue, Empty
+from threading import Thread, Lock, Event
+
+from lib.classes.reorder_buffer import ReorderBuffer
+
+FSYNC_NEVER = 'never'
+FSYNC_ON_FLUSH = 'flush'
+FSYNC_ON_CLOSE = 'close'
+
+
+class TranscriptWriter:
+    def __init__(self, paths, flush_interval=1.0, fsync_policy=FSYNC_ON_CLOSE):
+        # Keeps every transcript file open and writes from a single thread, flushing
+        # at most every flush_interval seconds instead of reopening files per segment.
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.queue = Queue()
+        self.lock = Lock()
+        # Orders segments written with a sequence number
+        self.buffer = ReorderBuffer()
+        self.files = []
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self.written_bytes = 0
+        self.flushes = 0
+        self._open(paths, [], {})
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, text, sequence=None):
+        # Without a sequence number, text is written in the order write() is called.
+        # With one, it is held back until all lower sequence numbers have been written.
+        if sequence is None:
+            self.queue.put(('write', text))
+            return
+        with self.lock:
+            for _, released_text in self.buffer.push(sequence, text):
+                self.queue.put(('write', released_text))
+
+    def rotate(self, paths, truncate_paths=(), headers=None):
+        # Switches to new files after everything queued so far has been written.
+        # headers maps a path to text written only into that file right after opening it.
+        with self.lock:
+            self.buffer.reset()
+        self.queue.put(('rotate', (paths, truncate_paths, headers or {})))
+
+    def flush(self, wait=True):
+        # Writes everything queued so far to disk, optionally waiting until that's done
+        done = Event()
+        self.queue.put(('flush', done))
+        if wait:
+            done.wait()
+
+    def close(self):
+        self.queue.put(('close', None))
+        self.thread.join()
+
+    def _open(self, paths, truncate_paths, headers):
+        for path in paths:
+            folder = os.path.dirname(path)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            mode = 'w' if path in truncate_paths else 'a'
+            file = open(path, mode, encoding='utf-8')
+            if path in headers:
+                file.write(headers[path])
+                self.dirty = True
+            self.files.append(file)
+
+    def _flush(self, fsync):
+        for file in self.files:
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+        self.dirty = False
+        self.last_flush = time.monotonic()
+        self.flushes += 1
+
+    def _close_files(self):
+        self._flush(self.fsync_policy != FSYNC_NEVER)
+        for file in self.files:
+            file.close()
+        self.files = []
+
+    def _run(self):
+        while True:
+            timeout = max(self.flush_interval - (time.monotonic() - self.last_flush), 0) if self.dirty else None
+            try:
+                command, argument = self.queue.get(timeout=timeout)
+            except Empty:
+                self._flush(self.fsync_policy == FSYNC_ON_FLUSH)
+                continue
+
+            if command == 'write':
+                for file in self.files:
+                    file.write(argument)
+                self.written_bytes += len(argument.encode('utf-8'))
+                self.dirty = True
+            elif command == 'flush':
+                self._flush(self.fsync_policy == FSYNC_ON_FLUSH)
+                argument.set()
+            elif command == 'rotate':
+                self._close_files()
+                self._open(*argument)
+            elif command == 'close':
+                self._close_files()
+                return
+
+            if self.dirty and time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush(self.fsync_policy == FSYNC_ON_FLUSH)
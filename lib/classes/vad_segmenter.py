@@ -0,0 +1,140 @@
+import wave
+from collections import deque
+
+import numpy as np
+import speech_recognition as sr
+
+
+def frame_features(frames):
+    # frames: (n, frame_length) int16 array. Returns RMS energy and zero-crossing rate per frame.
+    samples = frames.astype(np.float32)
+    energy = np.sqrt(np.mean(samples * samples, axis=1))
+    signs = np.signbit(samples)
+    zero_crossing_rate = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+    return energy, zero_crossing_rate
+
+
+class VadSegmenter:
+    def __init__(self, sample_rate=16000, frame_ms=30, min_energy=300, energy_ratio=3.0, max_zero_crossing_rate=.35,
+                 start_ms=90, end_silence_ms=600, pre_roll_ms=300, max_utterance_s=12):
+        # Splits a stream of 16 bit mono PCM into utterances at natural pauses. A frame counts
+        # as speech when it is clearly louder than the noise floor and not just hiss (high zero
+        # crossing rate), unless it is very loud. Utterances are cut at max_utterance_s.
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.min_energy = min_energy
+        self.energy_ratio = energy_ratio
+        self.max_zero_crossing_rate = max_zero_crossing_rate
+        self.start_frames = max(int(start_ms / frame_ms), 1)
+        self.end_silence_frames = max(int(end_silence_ms / frame_ms), 1)
+        self.pre_roll_frames = int(pre_roll_ms / frame_ms)
+        self.max_frames = int(max_utterance_s * 1000 / frame_ms)
+
+        # Ring buffer of the most recent frames, large enough for a full utterance plus pre-roll
+        self.capacity = self.max_frames + self.pre_roll_frames + 1
+        self.ring = np.zeros((self.capacity, self.frame_length), dtype=np.int16)
+        self.frame_count = 0
+        self.remainder = np.zeros(0, dtype=np.int16)
+
+        self.noise_floor = None
+        self.voiced_run = 0
+        self.silent_run = 0
+        self.utterance_start = None
+        # (start frame, end frame, pcm bytes) of finished utterances
+        self.utterances = deque()
+
+    def process(self, pcm):
+        # Feed raw PCM bytes of any length, returns the number of finished utterances waiting
+        samples = np.concatenate((self.remainder, np.frombuffer(pcm, dtype=np.int16)))
+        frame_total = len(samples) // self.frame_length
+        self.remainder = samples[frame_total * self.frame_length:]
+        if frame_total == 0:
+            return len(self.utterances)
+
+        frames = samples[:frame_total * self.frame_length].reshape(frame_total, self.frame_length)
+        energy, zero_crossing_rate = frame_features(frames)
+        if self.noise_floor is None:
+            # Capped so that a stream starting with speech doesn't take the speech as noise floor;
+            # in a louder room the floor rises to the background level over the first quiet frames
+            self.noise_floor = min(float(np.percentile(energy, 20)), self.min_energy / self.energy_ratio)
+
+        for i in range(frame_total):
+            self.ring[self.frame_count % self.capacity] = frames[i]
+            threshold = max(self.min_energy, self.noise_floor * self.energy_ratio)
+            voiced = energy[i] > threshold and (zero_crossing_rate[i] < self.max_zero_crossing_rate
+                                                or energy[i] > threshold * 4)
+            if not voiced:
+                # Noise floor follows the background level while nobody speaks
+                self.noise_floor = .95 * self.noise_floor + .05 * float(energy[i])
+            self._update_state(voiced)
+            self.frame_count += 1
+
+        return len(self.utterances)
+
+    def _update_state(self, voiced):
+        if self.utterance_start is None:
+            self.voiced_run = self.voiced_run + 1 if voiced else 0
+            if self.voiced_run >= self.start_frames:
+                start = self.frame_count - self.voiced_run + 1 - self.pre_roll_frames
+                self.utterance_start = max(start, self.frame_count - self.capacity + 1, 0)
+                self.silent_run = 0
+            return
+
+        self.silent_run = 0 if voiced else self.silent_run + 1
+        length = self.frame_count - self.utterance_start + 1
+        if self.silent_run >= self.end_silence_frames:
+            # Keep a little of the trailing silence, drop the rest
+            self._emit(self.frame_count - self.silent_run + self.end_silence_frames // 3)
+        elif length >= self.max_frames:
+            self._emit(self.frame_count)
+            # The speaker is still talking, continue right away
+            self.utterance_start = self.frame_count + 1
+            self.voiced_run = self.start_frames
+
+    def _emit(self, end):
+        indexes = np.arange(self.utterance_start, end + 1) % self.capacity
+        self.utterances.append((self.utterance_start, end, self.ring[indexes].tobytes()))
+        self.utterance_start = None
+        self.voiced_run = 0
+        self.silent_run = 0
+
+    def flush(self):
+        # Ends the current utterance, e.g. at the end of a file
+        if self.utterance_start is not None and self.frame_count > self.utterance_start:
+            self._emit(self.frame_count - 1)
+
+    def pop(self):
+        return self.utterances.popleft() if self.utterances else None
+
+    def frame_to_seconds(self, frame):
+        return frame * self.frame_length / self.sample_rate
+
+
+def listen_vad(source, segmenter, stop_event=None):
+    # Drop-in for Recognizer.listen on an opened sr.Microphone: reads raw frames until the
+    # segmenter reports an utterance. Returns None if stop_event is set first.
+    while not segmenter.utterances:
+        if stop_event is not None and stop_event.is_set():
+            return None
+        segmenter.process(source.stream.read(source.CHUNK))
+    _, _, pcm = segmenter.pop()
+    return sr.AudioData(pcm, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+
+
+def segment_wav(path, chunk_size=1024, **kwargs):
+    # Splits a 16 bit mono WAV file into utterances: [(start seconds, end seconds, pcm bytes)]
+    # Read in microphone sized chunks, so the noise floor starts from the beginning of the file
+    # like it does live instead of from the whole recording.
+    with wave.open(path, 'rb') as file:
+        if file.getsampwidth() != 2 or file.getnchannels() != 1:
+            raise ValueError(f"{path} must be 16 bit mono PCM")
+        segmenter = VadSegmenter(sample_rate=file.getframerate(), **kwargs)
+        while True:
+            pcm = file.readframes(chunk_size)
+            if not pcm:
+                break
+            segmenter.process(pcm)
+
+    segmenter.flush()
+    return [(segmenter.frame_to_seconds(start), segmenter.frame_to_seconds(end + 1), data)
+            for start, end, data in segmenter.utterances]
@@ -0,0 +1,97 @@
+import heapq
+import math
+
+import networkx as nx
+
+
+def rank_nodes(edge_weights, method='pagerank'):
+    # Importance of every node in the full co-occurrence graph, not just the edges that end up shown.
+    # pagerank runs on a sparse matrix (networkx uses scipy), k_core ranks by core number with
+    # weighted degree breaking ties.
+    G = nx.Graph()
+    for (source, target), weight in edge_weights.items():
+        if source == target:
+            continue
+        if G.has_edge(source, target):
+            G.edges[source, target]['weight'] += weight
+        else:
+            G.add_edge(source, target, weight=weight)
+    if len(G) == 0:
+        return {}
+
+    if method == 'pagerank':
+        return nx.pagerank(G, weight='weight')
+    if method == 'k_core':
+        core_numbers = nx.core_number(G)
+        degrees = dict(G.degree(weight='weight'))
+        return {node: (core_numbers[node], degrees[node]) for node in G.nodes}
+    raise ValueError(f"Unknown ranking method '{method}'")
+
+
+def select_detail_edges(edge_weights, level_sizes=(40, 120, 400), method='pagerank', edges_per_node=1.5):
+    # Nested levels of detail, computed once per graph: level i keeps the edges between the
+    # level_sizes[i] highest ranked nodes, at most edges_per_node per node and strongest first.
+    # Every level contains all edges of the levels before it, so zooming in only adds to the map.
+    # Returns [(edge, weight, level)] with level 0 the coarsest.
+    scores = rank_nodes(edge_weights, method)
+    ranked_nodes = sorted(scores, key=scores.get, reverse=True)
+
+    selected = []
+    selected_edges = set()
+    for level, size in enumerate(level_sizes):
+        nodes = set(ranked_nodes[:size])
+        candidates = [(edge, weight) for edge, weight in edge_weights.items()
+                      if edge not in selected_edges and edge[0] in nodes and edge[1] in nodes]
+        budget = int(size * edges_per_node) - len(selected)
+        for edge, weight in heapq.nlargest(max(budget, 0), candidates, key=lambda item: item[1]):
+            selected.append((edge, weight, level))
+            selected_edges.add(edge)
+    return selected
+
+
+def get_trace_level(trace):
+    return (trace.get('meta') or {}).get('level', 0)
+
+
+def apply_detail_level(figure, level):
+    # Copy of a figure dict with the traces finer than level hidden
+    if level is None:
+        return figure
+    data = [dict(trace, visible=get_trace_level(trace) <= level) for trace in figure.get('data', [])]
+    return dict(figure, data=data)
+
+
+def get_figure_extent(figure):
+    # (x span, y span) of everything drawn
+    spans = []
+    for axis in ('x', 'y'):
+        values = [value for trace in figure.get('data', []) for value in (trace.get(axis) or []) if value is not None]
+        spans.append(max(values) - min(values) if values else 0)
+    return spans
+
+
+def get_zoom_detail_level(relayout_data, figure, level_count):
+    # Level to show for the zoom in relayout_data: one level finer for every doubling of the zoom.
+    # None if relayout_data isn't about the axis ranges (e.g. a drag of the legend).
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange') or relayout_data.get('autosize'):
+        return 0
+
+    zooms = []
+    for i, axis in enumerate(('xaxis', 'yaxis')):
+        if f'{axis}.range[0]' in relayout_data:
+            visible_range = (relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]'])
+        elif f'{axis}.range' in relayout_data:
+            visible_range = relayout_data[f'{axis}.range']
+        else:
+            continue
+        full_span = get_figure_extent(figure)[i]
+        visible_span = abs(visible_range[1] - visible_range[0])
+        if full_span > 0 and visible_span > 0:
+            zooms.append(full_span / visible_span)
+    if not zooms:
+        return None
+
+    zoom = min(zooms)
+    return max(0, min(level_count - 1, int(math.floor(math.log2(zoom))) if zoom >= 1 else 0))
@@ -0,0 +1,143 @@
+import networkx as nx
+import numpy as np
+
+
+def build_quadtree(pos, levels):
+    # Level-wise quadtree over the bounding square: level l is a 2^l x 2^l grid. Per level the
+    # node count (mass) and center of mass of every cell, plus each node's cell index.
+    low = pos.min(axis=0)
+    size = max(float((pos.max(axis=0) - low).max()), 1e-9) * (1 + 1e-9)
+    unit = (pos - low) / size
+    tree = []
+    for level in range(levels + 1):
+        cells_per_side = 2 ** level
+        cell_xy = np.minimum((unit * cells_per_side).astype(np.int64), cells_per_side - 1)
+        cell = cell_xy[:, 0] * cells_per_side + cell_xy[:, 1]
+        cell_count = cells_per_side * cells_per_side
+        mass = np.bincount(cell, minlength=cell_count).astype(float)
+        center = np.stack([np.bincount(cell, weights=pos[:, 0], minlength=cell_count),
+                           np.bincount(cell, weights=pos[:, 1], minlength=cell_count)], axis=1)
+        center /= np.maximum(mass, 1)[:, np.newaxis]
+        tree.append((mass, center, cell, size / cells_per_side))
+    return tree
+
+
+def repulsion(pos, k, theta=1.0, levels=None):
+    # Barnes-Hut approximation of the Fruchterman-Reingold repulsion sum_j delta_ij * k^2 / d_ij^2.
+    # All nodes descend the tree together: the frontier holds (node, cell) pairs of the current
+    # level. Cells far enough away (cell size / distance < theta) are treated as one mass at their
+    # center, the others are replaced by their non-empty children on the next level.
+    n = len(pos)
+    if levels is None:
+        # About one node per leaf cell
+        levels = min(max(int(np.ceil(np.log(max(n, 2)) / np.log(4))) + 1, 1), 10)
+    tree = build_quadtree(pos, levels)
+    displacement = np.zeros_like(pos)
+
+    nodes = np.repeat(np.arange(n), 4)
+    cells = np.tile(np.arange(4), n)
+    for level in range(1, levels + 1):
+        mass, center, node_cell, cell_size = tree[level]
+        keep = mass[cells] > 0
+        nodes, cells = nodes[keep], cells[keep]
+        if len(nodes) == 0:
+            break
+
+        delta = pos[nodes] - center[cells]
+        # Squared distances, with the same 0.01 minimum distance as spring_layout
+        distance2 = np.maximum(np.einsum('ij,ij->i', delta, delta), 1e-4)
+        own = node_cell[nodes] == cells
+        if level == levels:
+            # Leaves: everything left is applied, a node's own cell without the node itself
+            cell_mass = mass[cells].copy()
+            own_center = center[cells[own]] * cell_mass[own, np.newaxis] - pos[nodes[own]]
+            cell_mass[own] -= 1
+            own_center /= np.maximum(cell_mass[own], 1)[:, np.newaxis]
+            delta[own] = pos[nodes[own]] - own_center
+            distance2[own] = np.maximum(np.einsum('ij,ij->i', delta[own], delta[own]), 1e-4)
+            far = np.ones(len(nodes), dtype=bool)
+        else:
+            cell_mass = mass[cells]
+            far = ~own & (cell_size * cell_size < theta * theta * distance2)
+
+        force = delta[far] * (k * k * cell_mass[far] / distance2[far])[:, np.newaxis]
+        displacement[:, 0] += np.bincount(nodes[far], weights=force[:, 0], minlength=n)
+        displacement[:, 1] += np.bincount(nodes[far], weights=force[:, 1], minlength=n)
+
+        if level == levels:
+            break
+        # Children of cell (x, y) on the next level are (2x + dx, 2y + dy)
+        near_nodes, near_cells = nodes[~far], cells[~far]
+        cells_per_side = 2 ** level
+        x, y = near_cells // cells_per_side, near_cells % cells_per_side
+        children = [(2 * x + dx) * 2 * cells_per_side + 2 * y + dy for dx in (0, 1) for dy in (0, 1)]
+        nodes = np.concatenate([near_nodes] * 4)
+        cells = np.concatenate(children)
+
+    return displacement
+
+
+def barnes_hut_layout(G, pos=None, iterations=50, threshold=1e-4, weight='weight', theta=1.0, temperature=None,
+                      scale=1, seed=None, gravity=0, step_size=None):
+    # Force-directed layout like nx.spring_layout (same forces, edge weights scale attraction,
+    # result rescaled to scale), but repulsion costs O(N log N) per iteration instead of O(N^2).
+    # pos gives starting positions for some or all nodes, the others start at random.
+    # Like spring_layout every node moves by the current temperature per iteration, unless
+    # step_size is given: then steps are step_size times the force, capped by the temperature,
+    # which together with gravity lets warm started layouts settle (see warm_start_layout):
+    # then iterations stop before a step below threshold, and scale=None keeps the positions' scale.
+    nodes = list(G.nodes)
+    if len(nodes) == 0:
+        return {}
+    if len(nodes) == 1:
+        return {nodes[0]: np.zeros(2)}
+
+    rng = np.random.default_rng(seed)
+    positions = rng.random((len(nodes), 2))
+    if pos is not None:
+        for i, node in enumerate(nodes):
+            if node in pos:
+                positions[i] = pos[node]
+
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(index[u], index[v], data.get(weight, 1)) for u, v, data in G.edges(data=True) if u != v]
+    sources = np.array([edge[0] for edge in edges], dtype=np.int64)
+    targets = np.array([edge[1] for edge in edges], dtype=np.int64)
+    weights = np.array([edge[2] for edge in edges], dtype=float)
+
+    k = np.sqrt(1.0 / len(nodes))
+    if temperature is None:
+        # Same starting temperature as spring_layout
+        temperature = max(float(np.ptp(positions[:, 0])), float(np.ptp(positions[:, 1]))) * 0.1
+    t = temperature
+    dt = temperature / (iterations + 1)
+    for _ in range(iterations):
+        displacement = repulsion(positions, k, theta)
+
+        # Attraction along edges, weight * d^2 / k towards each other
+        delta = positions[sources] - positions[targets]
+        distance = np.maximum(np.linalg.norm(delta, axis=1), 0.01)
+        force = delta * (weights * distance / k)[:, np.newaxis]
+        for dimension in range(2):
+            displacement[:, dimension] -= np.bincount(sources, weights=force[:, dimension], minlength=len(nodes))
+            displacement[:, dimension] += np.bincount(targets, weights=force[:, dimension], minlength=len(nodes))
+
+        displacement -= gravity * positions
+
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 0.01)
+        if step_size is None:
+            step = displacement * (t / length)[:, np.newaxis]
+            converged = np.linalg.norm(step) / len(nodes) < threshold
+        else:
+            step = displacement * np.minimum(step_size, t / length)[:, np.newaxis]
+            if np.mean(np.linalg.norm(step, axis=1)) < threshold:
+                break
+            converged = False
+        positions += step
+        t -= dt
+        if converged:
+            break
+
+    if scale is not None:
+        positions = nx.rescale_layout(positions, scale=scale)
+    return dict(zip(nodes, positions))
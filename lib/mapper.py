@@ -1,45 +1,145 @@
+import heapq
+from collections import Counter
+
 import networkx as nx
 import numpy as np
 
+from lib.classes.layout_cache import graph_fingerprint
+from lib.community_layout import community_layout
+from lib.detail_levels import select_detail_edges
+from lib.force_layout import barnes_hut_layout
+
 
-def create_mind_map_force(proximity_links):
+def create_mind_map_force(proximity_links, top_count=100, layout='spring', layout_cache=None, level_sizes=None):
+    # layout is 'spring' (networkx, fine up to a few hundred nodes), 'barnes_hut' (lib.force_layout,
+    # for thousands of nodes) or 'community' (lib.community_layout, clusters laid out in parallel).
+    # With a lib.classes.layout_cache.LayoutCache, a graph that was laid out before is not laid out again.
+    # With level_sizes, nodes and edges are picked by rank into nested detail levels instead of
+    # the top_count edges by weight (see add_nodes_and_edges).
     G = nx.Graph()
 
     # Add nodes and edges to the graph
-    add_nodes_and_edges(G, proximity_links)
-
-    # List to hold subgraphs for nodes with the threshold condition
-    subgraphs = []
-
-    # Define the threshold for connected nodes
-    threshold = 2
-
-    # Create subgraphs for nodes with the threshold or more connected nodes
-    for node in G.nodes:
-        connected_nodes = set(G.neighbors(node))
-
-        # Check if the node meets the threshold condition
-        if len(connected_nodes) >= threshold:
-            subgraph = G.subgraph(connected_nodes).copy()
-            subgraphs.append(subgraph)
-
-    # Generate positions for each subgraph using spring_layout
+    add_nodes_and_edges(G, proximity_links, top_count, level_sizes)
+
+    if layout_cache is not None:
+        key = graph_fingerprint(G, layout)
+        positions = layout_cache.get(key)
+        if positions is not None:
+            return G, positions
+
+    if layout in ('barnes_hut', 'community'):
+        # Shell layouts per neighborhood would cost more than the whole layout at this size
+        positions = layout_from_neighborhoods(G, {}, layout)
+    else:
+        # Seed positions for nodes with the threshold or more connected nodes
+        neighborhood_positions = {}
+        for node in G.nodes:
+            node_positions = get_neighborhood_positions(G, node)
+            if node_positions is not None:
+                neighborhood_positions[node] = node_positions
+        positions = layout_from_neighborhoods(G, neighborhood_positions, layout)
+
+    if layout_cache is not None and positions:
+        layout_cache.put(key, positions)
+    return G, positions
+
+
+def get_neighborhood_positions(G, node, threshold=2, scale=0.4):
+    # Shell layout of the node's neighbors, None if it has fewer than threshold of them.
+    # It only depends on the neighbors, so it stays valid until an edge of the node changes.
+    connected_nodes = list(G.adj[node])
+    if len(connected_nodes) < threshold:
+        return None
+    return nx.shell_layout(connected_nodes, scale=scale)
+
+
+def layout_from_neighborhoods(G, neighborhood_positions, layout='spring'):
+    # Combine the neighborhood layouts in node order, later ones win for shared nodes
     all_positions = {}
-    for subgraph in subgraphs:
-        positions = nx.shell_layout(subgraph, scale=0.4)
-        for node in subgraph.nodes:
-            all_positions[node] = positions[node]
-
-    if len(all_positions) == 0:
-        print("No nodes found with the threshold condition.")
-        return G, all_positions
-
-    all_positions = nx.spring_layout(G, pos=all_positions, iterations=50)
+    for node in G.nodes:
+        if node in neighborhood_positions:
+            all_positions.update(neighborhood_positions[node])
+
+    if layout == 'barnes_hut':
+        if len(G) == 0:
+            return all_positions
+        all_positions = barnes_hut_layout(G, pos=all_positions, iterations=50)
+    elif layout == 'community':
+        if len(G) == 0:
+            return all_positions
+        all_positions = community_layout(G)
+    elif layout == 'spring':
+        if len(all_positions) == 0:
+            print("No nodes found with the threshold condition.")
+            return all_positions
+        all_positions = nx.spring_layout(G, pos=all_positions, iterations=50)
+    else:
+        raise ValueError(f"Unknown layout '{layout}'")
 
     # Call move_subgraphs function to adjust positions
     all_positions = move_subgraphs(G, all_positions)
 
-    return G, all_positions
+    return all_positions
+
+
+def place_new_nodes(G, previous_positions, spread=0.05):
+    # Keeps the previous position of known nodes. New nodes go next to their already placed
+    # neighbors, growing outwards from the known part of the graph; the rest near the center.
+    positions = {node: previous_positions[node] for node in G.nodes if node in previous_positions}
+    pending = [node for node in G.nodes if node not in positions]
+    while pending:
+        remaining = []
+        for node in pending:
+            placed_neighbors = [positions[neighbor] for neighbor in G.adj[node] if neighbor in positions]
+            if placed_neighbors:
+                positions[node] = np.mean(placed_neighbors, axis=0) + np.random.uniform(-spread, spread, 2)
+            else:
+                remaining.append(node)
+        if len(remaining) == len(pending):
+            for node in remaining:
+                positions[node] = np.random.uniform(-spread, spread, 2)
+            break
+        pending = remaining
+    return positions
+
+
+def warm_start_layout(G, previous_positions, max_iterations=50, threshold=1e-3, temperature=0.05, gravity=1.0,
+                      step_size=0.03, layout='spring'):
+    # Continues from the previous frame instead of starting over: Fruchterman-Reingold steps
+    # (same forces and weights as spring_layout) with a low starting temperature, stopped once
+    # the average node would move less than threshold. For a mostly unchanged graph that is after
+    # a few iterations, for a settled one before the first. move_subgraphs isn't applied again,
+    # its pull is already in the positions. Not rescaled: only the layout from scratch is, later
+    # frames keep its scale so a settled graph stays where it is.
+    positions = place_new_nodes(G, previous_positions)
+    if len(positions) < 2:
+        return positions
+    if layout in ('barnes_hut', 'community'):
+        # Communities only matter for the first layout, afterwards nodes just settle
+        return barnes_hut_layout(G, pos=positions, iterations=max_iterations, threshold=threshold,
+                                 temperature=temperature, gravity=gravity, step_size=step_size, scale=None)
+
+    nodes = list(G.nodes)
+    pos = np.array([positions[node] for node in nodes], dtype=float)
+    adjacency = nx.to_numpy_array(G, nodelist=nodes, weight='weight')
+    k = np.sqrt(1.0 / len(nodes))
+    t = temperature
+    dt = temperature / (max_iterations + 1)
+    for _ in range(max_iterations):
+        delta = pos[:, np.newaxis, :] - pos[np.newaxis, :, :]
+        distance = np.maximum(np.linalg.norm(delta, axis=-1), 0.01)
+        displacement = np.einsum('ijk,ij->ik', delta, k * k / distance ** 2 - adjacency * distance / k)
+        # Weak pull to the center, without it unconnected parts drift apart forever
+        displacement -= gravity * pos
+        length = np.maximum(np.linalg.norm(displacement, axis=-1), 0.01)
+        # Move along the force, damped and never further than the current temperature
+        step = displacement * np.minimum(step_size, t / length)[:, np.newaxis]
+        if np.mean(np.linalg.norm(step, axis=-1)) < threshold:
+            break
+        pos += step
+        t -= dt
+
+    return dict(zip(nodes, pos))
 
 
 def move_subgraphs(G, all_positions):
@@ -59,12 +159,12 @@ def move_subgraphs(G, all_positions):
     return all_positions
 
 
-def add_nodes_and_edges(G, proximity_links):
+def aggregate_links(proximity_links):
+    # Sums the weights of repeated links. Returns the edge weights, the last category seen
+    # per node and the number of distinct edges per node (used as the node size).
     edge_weights = {}
     node_categories = {}
-    top_count = 100
 
-    # First, create all edges and their weights without adding them to the graph.
     for link in proximity_links:
         edge = (link['source'], link['target'])
         if edge in edge_weights:
@@ -75,17 +175,40 @@ def add_nodes_and_edges(G, proximity_links):
         node_categories[link['source']] = link['source_category']
         node_categories[link['target']] = link['target_category']
 
-    # Then, sort edges by weight and select top_count or fewer if the total number is less than top_count.
-    sorted_edges = sorted(edge_weights.items(), key=lambda item: item[1], reverse=True)
-    top_edges = sorted_edges[:top_count] if len(sorted_edges) > top_count else sorted_edges
+    degrees = Counter()
+    for source, target in edge_weights:
+        degrees[source] += 1
+        if target != source:
+            degrees[target] += 1
+
+    return edge_weights, node_categories, degrees
+
+
+def select_top_edges(edge_weights, top_count=100):
+    # The top_count edges by weight, ties keep their original order as a stable sort would
+    return heapq.nlargest(top_count, edge_weights.items(), key=lambda item: item[1])
+
+
+def select_edges(edge_weights, top_count=100, level_sizes=None):
+    # [(edge, weight, level)]: the top_count edges by weight all on level 0, or with level_sizes the
+    # edges of every detail level of lib.detail_levels, which are laid out once for the finest level
+    if level_sizes is None:
+        return [(edge, weight, 0) for edge, weight in select_top_edges(edge_weights, top_count)]
+    return select_detail_edges(edge_weights, level_sizes)
+
+
+def add_nodes_and_edges(G, proximity_links, top_count=100, level_sizes=None):
+    edge_weights, node_categories, degrees = aggregate_links(proximity_links)
 
-    # Now, add the top edges and their nodes to the graph.
-    for edge, weight in top_edges:
+    # Add the selected edges and their nodes to the graph. A node's level is the coarsest of its edges.
+    for edge, weight, level in select_edges(edge_weights, top_count, level_sizes):
         source, target = edge
-        if source not in G.nodes:
-            G.add_node(source, category=node_categories[source],
-                       size=len([e for e in edge_weights if e[0] == source or e[1] == source]))
-        if target not in G.nodes:
-            G.add_node(target, category=node_categories[target],
-                       size=len([e for e in edge_weights if e[0] == target or e[1] == target]))
-        G.add_edge(source, target, weight=weight)
+        for node in (source, target):
+            if node not in G.nodes:
+                G.add_node(node, category=node_categories[node], size=degrees[node], level=level)
+            else:
+                G.nodes[node]['level'] = min(G.nodes[node]['level'], level)
+        if G.has_edge(source, target):
+            # (target, source) was added before, on the same or a coarser level
+            level = G.edges[source, target]['level']
+        G.add_edge(source, target, weight=weight, level=level)
@@ -2,10 +2,26 @@ import plotly.graph_objects as go
 from lib.colors import generate_unique_color
 
 
-def create_plot(G, subgraph_positions, live_mode=False, show_labels=True, title="Mind Map"):
+# Edge widths are rounded to this step so that all edges fit into a few traces
+edge_width_step = 0.5
+# Above this many nodes plus edges, maps are drawn with WebGL (Scattergl) instead of SVG
+webgl_threshold = 1500
+# In WebGL mode only the highest degree nodes are labeled, the others show their name on hover
+webgl_label_count = 100
+
+
+def create_plot(G, subgraph_positions, live_mode=False, show_labels=True, title="Mind Map", webgl=None):
     print("Creating plot...")
-    # Create Plotly figure
+    # Create Plotly figure. Edges are batched into one trace per detail level and width, nodes into
+    # one trace per detail level and category; None entries separate the edge segments.
+    # webgl=None picks WebGL automatically for large maps.
     edge_traces = []
+    if webgl is None:
+        webgl = G.number_of_nodes() + G.number_of_edges() > webgl_threshold
+    scatter = go.Scattergl if webgl else go.Scatter
+    labeled_nodes = None
+    if webgl:
+        labeled_nodes = set(node for node, _ in sorted(G.degree, key=lambda item: item[1], reverse=True)[:webgl_label_count])
 
     category_colors = {}  # Dictionary to store unique colors per category
 
@@ -15,65 +31,78 @@ def create_plot(G, subgraph_positions, live_mode=False, show_labels=True, title=
     else:
         max_degree = max(values)  # Calculate the maximum degree in the graph
 
-    max_weight = [edge[2]['weight'] for edge in G.edges(data=True) if 'weight' in edge[2]]
-    min_weight = min(max_weight) if len(max_weight) > .5 else .5
+    weights = [edge[2]['weight'] for edge in G.edges(data=True) if 'weight' in edge[2]]
+    min_weight = min(weights) if len(weights) > .5 else .5
+    max_weight = max(weights) if weights else 1
+
+    # (level, width) -> ([x], [y])
+    edge_batches = {}
     for edge in G.edges(data=True):
         try:
             x0, y0 = subgraph_positions[edge[0]]
             x1, y1 = subgraph_positions[edge[1]]
-            weight = edge[2]['weight'] if 'weight' in edge[2] else 1
-            weight = (weight - min_weight) / max(max_weight) * 5
-
-            edge_trace = go.Scatter(
-                x=[x0, (x0 + x1) / 2, x1, None],
-                y=[y0, (y0 + y1) / 2, y1, None],
-                line=dict(width=weight, color='#888'),
-                hoverinfo='none',
-                mode='lines',
-                showlegend=False,
-            )
-
-            edge_traces.append(edge_trace)
         except KeyError:
             print(f"Edge {edge} not found in subgraph_positions")
             continue
+        weight = edge[2]['weight'] if 'weight' in edge[2] else 1
+        width = round((weight - min_weight) / max_weight * 5 / edge_width_step) * edge_width_step
+        x, y = edge_batches.setdefault((edge[2].get('level', 0), width), ([], []))
+        x.extend((x0, (x0 + x1) / 2, x1, None))
+        y.extend((y0, (y0 + y1) / 2, y1, None))
 
-    node_mode = 'markers+text' if show_labels else 'markers'
+    for (level, width), (x, y) in sorted(edge_batches.items(), key=lambda item: item[0]):
+        edge_traces.append(scatter(
+            x=x,
+            y=y,
+            line=dict(width=width, color='#888'),
+            hoverinfo='none',
+            mode='lines',
+            showlegend=False,
+            # Detail level (see lib.detail_levels), the coarsest level 0 is left out
+            meta={'level': level} if level else None,
+        ))
+
+    # (level, category) -> node attribute lists
+    node_batches = {}
     for node in G.nodes():
+        if node not in subgraph_positions:
+            print(f"Node {node} not found in subgraph_positions")
+            continue
         category = G.nodes[node].get('category', 'default')  # Get the category property
         size = G.degree[node] / max_degree  # Calculate relative node size based on the degree
         size = max(size * 25, 1)
 
         if category not in category_colors:
             # Generate a unique color for the category with good contrast against white
-            color = generate_unique_color(category_colors.values())
-            category_colors[category] = color
-        else:
-            color = category_colors[category]
+            category_colors[category] = generate_unique_color(category_colors.values())
 
-        node_text = node if live_mode else node + f" ({category})"
-        try:
-            node_trace = go.Scatter(
-                x=[subgraph_positions[node][0]],
-                y=[subgraph_positions[node][1]],
-                mode=node_mode,
-                marker=dict(
-                    showscale=False,
-                    color=f"rgb{color}",
-                    size=size,
-                    line=dict(width=2)
-                ),
-                text=[node],
-                hovertext=[node_text],
-                textfont=dict(color='black', size=10),
-                hoverinfo='text',
-                textposition="middle right",
-            )
+        batch = node_batches.setdefault((G.nodes[node].get('level', 0), category),
+                                        {'x': [], 'y': [], 'size': [], 'text': [], 'hovertext': []})
+        batch['x'].append(subgraph_positions[node][0])
+        batch['y'].append(subgraph_positions[node][1])
+        batch['size'].append(size)
+        batch['text'].append(node if labeled_nodes is None or node in labeled_nodes else "")
+        batch['hovertext'].append(node if live_mode else node + f" ({category})")
 
-            edge_traces.append(node_trace)
-        except KeyError:
-            print(f"Node {node} not found in subgraph_positions")
-            continue
+    node_mode = 'markers+text' if show_labels else 'markers'
+    for (level, category), batch in node_batches.items():
+        edge_traces.append(scatter(
+            x=batch['x'],
+            y=batch['y'],
+            mode=node_mode,
+            marker=dict(
+                showscale=False,
+                color=f"rgb{category_colors[category]}",
+                size=batch['size'],
+                line=dict(width=2)
+            ),
+            text=batch['text'],
+            hovertext=batch['hovertext'],
+            textfont=dict(color='black', size=10),
+            hoverinfo='text',
+            textposition="middle right",
+            meta={'level': level} if level else None,
+        ))
 
     go_fig = go.Figure(data=edge_traces,
                        layout=go.Layout(
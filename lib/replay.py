@@ -0,0 +1,136 @@
+import time
+import wave
+
+import numpy as np
+import speech_recognition as sr
+
+from lib.classes.recognition_pool import RecognitionPool
+from lib.classes.recognizers import FakeRecognizer
+from lib.classes.vad_segmenter import segment_wav
+
+
+def load_transcript_segments(path, words_per_segment=12, words_per_minute=150):
+    # Splits a transcript into timed segments as if it was spoken at words_per_minute:
+    # [(seconds since start, text)]
+    with open(path, 'r', encoding='utf-8') as f:
+        words = f.read().split()
+
+    segments = []
+    for i in range(0, len(words), words_per_segment):
+        chunk = words[i:i + words_per_segment]
+        segments.append(((i + len(chunk)) * 60 / words_per_minute, " ".join(chunk)))
+    return segments
+
+
+def assign_texts(durations, text):
+    # Spreads the words of a transcript over utterances in proportion to their duration,
+    # so a fake recognizer returns plausible text for each one
+    words = text.split()
+    if not durations:
+        return []
+    boundaries = np.round(np.cumsum(durations) / sum(durations) * len(words)).astype(int)
+    texts = []
+    start = 0
+    for i, end in enumerate(boundaries):
+        texts.append(" ".join(words[start:end]) or f"Segment {i}.")
+        start = end
+    return texts
+
+
+def load_wav_segments(paths, **kwargs):
+    # Cuts WAV files into utterances like the live VAD would: [(seconds since start, sr.AudioData)]
+    # Files are played one after another.
+    segments = []
+    offset = 0
+    for path in paths:
+        with wave.open(path, 'rb') as file:
+            sample_rate = file.getframerate()
+            duration = file.getnframes() / sample_rate
+        for start, end, pcm in segment_wav(path, **kwargs):
+            segments.append((offset + end, sr.AudioData(pcm, sample_rate, 2)))
+        offset += duration
+    return segments
+
+
+def load_replay(sources, text_file=None, words_per_segment=12, words_per_minute=150, **recognizer_kwargs):
+    # Returns (segments, recognizer) for replay(): a transcript is replayed as text, WAV files as
+    # audio through a FakeRecognizer answering with text_file spread over the utterances
+    if not sources[0].endswith('.wav'):
+        return load_transcript_segments(sources[0], words_per_segment, words_per_minute), None
+
+    segments = load_wav_segments(sources)
+    text = ""
+    if text_file is not None:
+        with open(text_file, 'r', encoding='utf-8') as f:
+            text = f.read()
+    durations = [len(audio.frame_data) / (audio.sample_rate * audio.sample_width) for _, audio in segments]
+    # Recognitions run in parallel, so texts are looked up by utterance rather than taken in order
+    texts = {id(audio): utterance_text for (_, audio), utterance_text in zip(segments, assign_texts(durations, text))}
+    return segments, FakeRecognizer(transcribe=lambda audio: texts[id(audio)], **recognizer_kwargs)
+
+
+def wait_until_rendered(session, timeout=60):
+    # True once every segment of the session's conversation is part of a published figure
+    processor = session.processor
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        last_segment = session.transcript.get_last()
+        if last_segment is None or (processor.last_rendered_conversation_id == session.conversation_id
+                                    and processor.last_rendered_segment_id >= last_segment.id):
+            return True
+        processor.wait_for_update(processor.version, timeout=.1)
+    return False
+
+
+def replay(session, segments, speed=1.0, recognizer=None, workers=4, timeout=30, render_timeout=60):
+    # Feeds timed segments into a LiveSession as the microphone pipeline would and returns
+    # the end-to-end latency of every segment: time from "capture" until it is in a published figure.
+    # segments are (seconds since start, item), item is either text or audio for recognizer.
+    # speed scales the timeline, 0 plays everything as fast as possible.
+    latencies = []
+
+    def on_rendered(segments, rendered_at):
+        latencies.extend(rendered_at - segment.created for segment in segments)
+
+    session.processor.on_rendered = on_rendered
+
+    pool = None
+    if recognizer is not None:
+        def recognize(audio):
+            return recognizer.stream(audio, session.selected_lang)
+
+        def publish_text(text, captured_at):
+            session.add_text(text + " ", captured_at)
+
+        pool = RecognitionPool(recognize, publish_text, workers, timeout, on_partial=session.set_partial)
+
+    start = time.monotonic()
+    for seconds, item in segments:
+        if speed:
+            delay = start + seconds / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if isinstance(item, str):
+            session.add_text(item + " ")
+        else:
+            pool.submit(item, time.time())
+
+    if pool is not None:
+        pool.wait(timeout)
+        pool.shutdown()
+
+    if not wait_until_rendered(session, render_timeout):
+        print(f"Replay - Not every segment was rendered within {render_timeout}s")
+    session.processor.on_rendered = None
+    return latencies
+
+
+def summarize_latencies(latencies, percentiles=(50, 90, 95, 99)):
+    if not latencies:
+        return {'segments': 0}
+    summary = {'segments': len(latencies)}
+    for percentile in percentiles:
+        summary[f'p{percentile}'] = float(np.percentile(latencies, percentile))
+    summary['max'] = float(np.max(latencies))
+    summary['mean'] = float(np.mean(latencies))
+    return summary
@@ -3,6 +3,7 @@ import nltk as nltk
 from deepmultilingualpunctuation import PunctuationModel
 
 from lib.advanced_text_processing import extract_logical_links_advanced
+from lib.classes.layout_cache import LayoutCache
 from lib.classes.timer import Timer
 from lib.mapper import create_mind_map_force
 from lib.plotly_wrapper import create_plot
@@ -13,8 +14,16 @@ selected_lang = 'de'
 nltk.download('averaged_perceptron_tagger')
 nltk.download('wordnet')
 
-if len(sys.argv) > 1:
-    source_file = sys.argv[1]
+# With --layout-cache, layouts are kept on disk (at most the 256 most recent ones), re-running on the
+# same text doesn't lay the map out again. Off by default so runs, e.g. by benchmarking/benchmarker.py,
+# stay comparable.
+layout_cache = None
+if '--layout-cache' in sys.argv:
+    layout_cache = LayoutCache(folder="layout_cache", max_files=256)
+
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+if arguments:
+    source_file = arguments[0]
 else:
     source_file = "transcripts/transcript_latest.txt"
 
@@ -25,7 +34,7 @@ def generate_plot(text):
     timer.start(f"{len(text)}")
     text = punctuation_model.restore_punctuation(text)
     logical_links = extract_logical_links_advanced(text, selected_lang)
-    G, positions = create_mind_map_force(logical_links)
+    G, positions = create_mind_map_force(logical_links, layout_cache=layout_cache)
     timer.stop()
     create_plot(G, positions)
 
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import threading
 import speech_recognition as sr
@@ -5,43 +6,70 @@ import os
 import keyboard
 from datetime import datetime
 
+from lib.classes.async_pipeline import AsyncPipeline, PipelineStage
+from lib.classes.recognition_pool import RecognitionPool
+from lib.classes.vad_segmenter import VadSegmenter, listen_vad
+from lib.classes.transcript_writer import TranscriptWriter
+
 if len(sys.argv) > 1:
     timeout = int(sys.argv[1])
 else:
     timeout = -1
 
+# Utterances recognized in parallel, and how long one may take before it is skipped
+recognition_workers = 4
+recognition_timeout = 30
+# Longest utterance sent to recognition while someone speaks without pausing
+max_utterance_s = 5
+
+
+def voice_to_text():
+    global audio_pipeline
 
-def voice_to_text(stop_event_ref):
     # Function to handle speech recognition
     def recognize_audio(audio_source):
         try:
             text = r.recognize_google(audio_source, language=google_lang[selected_lang])
             print(f"Recognized Text: {text}")
-            with open(transcript_file, 'a', encoding='utf-8') as file:
-                file.write(text + " ")
-            with open(latest_transcript_file, 'a', encoding='utf-8') as file:
-                file.write(text + " ")
+            return text
         except sr.UnknownValueError:
             print("Speech recognition could not understand audio.")
         except sr.RequestError as e:
             print("Could not request results from Google Speech Recognition service; {0}".format(e))
-        except Exception as e:
-            print(e)
+        return None
+
+    # Called in capture order
+    def write_text(text, captured_at):
+        transcript_writer.write(text + " ")
 
-    # Record audio continuously until stop event is set
+    def submit_audio(audio_source, captured_at):
+        recognition_pool.submit(audio_source, captured_at)
+
+    def reset():
+        recognition_pool.reset()
+        reset_transcript()
+
+    recognition_pool = RecognitionPool(recognize_audio, write_text, recognition_workers, recognition_timeout)
+
+    # Record audio continuously until the pipeline is stopped
     with sr.Microphone(device_index=0) as source:
-        while not stop_event_ref.is_set():
+        # Cuts utterances at natural pauses instead of waiting for a fixed phrase time limit
+        segmenter = VadSegmenter(sample_rate=source.SAMPLE_RATE, max_utterance_s=max_utterance_s)
+
+        def capture_audio():
             print("Recording audio...")
-            try:
-                audio = r.listen(source, phrase_time_limit=5)
+            audio = listen_vad(source, segmenter, audio_pipeline.stopping)
+            if audio is not None:
                 print("Audio recording complete.")
-            except sr.WaitTimeoutError:
-                print("No speech detected. Trying again...")
-                continue
+            return audio
 
-            # Create a new thread for speech recognition
-            recognition_thread = threading.Thread(target=recognize_audio, args=(audio,))
-            recognition_thread.start()
+        # Only capture and submission to the recognition pool are pipeline stages; a full pool holds
+        # back capture. Writing the transcript runs outside the pipeline with no backpressure.
+        audio_pipeline = AsyncPipeline(capture_audio, [PipelineStage('recognition', submit_audio)], on_reset=reset)
+        asyncio.run(audio_pipeline.run())
+    recognition_pool.shutdown()
+    transcript_writer.close()
+    stop_event.set()
 
 
 languages = ['en', 'de']
@@ -58,6 +86,8 @@ reset_words = {
 selected_lang = 'de'
 
 r = sr.Recognizer()
+# A hung request would hold its pool worker long after the pool skipped the utterance
+r.operation_timeout = recognition_timeout
 
 # use current timestamp as unique identifier for the transcript
 conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
@@ -65,8 +95,12 @@ transcript_folder = "transcripts/"
 transcript_file = f"{transcript_folder}transcript_{conversation_id}.txt"
 latest_transcript_file = f"{transcript_folder}transcript_latest.txt"
 
-# Create an event to control the audio recording
+# Keeps both transcript files open and batches writes
+transcript_writer = TranscriptWriter([transcript_file, latest_transcript_file])
+
+# Set once the audio pipeline has stopped
 stop_event = threading.Event()
+audio_pipeline = None
 
 # Create a lock to synchronize access to the accumulated text
 lock = threading.Lock()
@@ -76,8 +110,10 @@ lock = threading.Lock()
 def stop_key_press(event):
     with lock:
         print("Stopping...")
+        transcript_writer.flush()
         os.system(f"python plotter.py {transcript_file}")
-        stop_event.set()
+        if audio_pipeline is not None:
+            audio_pipeline.stop()
 
 
 def handle_lang_change(event):
@@ -86,13 +122,22 @@ def handle_lang_change(event):
     print(f"Changed language to {selected_lang}")
 
 
-def handle_reset(event):
+def reset_transcript():
     global conversation_id, transcript_file
-    print("Resetting...")
     conversation_id = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
     transcript_file = f"transcripts/transcript_{conversation_id}.txt"
-    with open(latest_transcript_file, 'w', encoding='utf-8') as file:
-        file.write(transcript_file)
+    # As before, the latest transcript file starts over with the path of the new transcript
+    transcript_writer.rotate([transcript_file, latest_transcript_file], truncate_paths=[latest_transcript_file],
+                             headers={latest_transcript_file: transcript_file})
+
+
+def handle_reset(event):
+    print("Resetting...")
+    # Drops audio and text still in flight from before the reset
+    if audio_pipeline is not None:
+        audio_pipeline.reset()
+    else:
+        reset_transcript()
 
 
 # Register the stop key press callback
@@ -101,7 +146,7 @@ keyboard.on_press_key("F4", handle_lang_change)
 keyboard.on_press_key("F3", handle_reset)
 
 # Create a thread for continuous audio recording
-audio_thread = threading.Thread(target=voice_to_text, args=(stop_event,))
+audio_thread = threading.Thread(target=voice_to_text)
 print("Starting audio thread...")
 audio_thread.start()
 
@@ -114,3 +159,5 @@ if not os.path.exists('transcripts'):
 if timeout > 0:
     print(f"Recording for {timeout} seconds before stopping...")
     stop_event.wait(timeout)
+    if audio_pipeline is not None:
+        audio_pipeline.stop()
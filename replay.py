@@ -0,0 +1,55 @@
+import argparse
+import json
+import tempfile
+
+from lib.classes.background_processor import BackgroundProcessor
+from lib.classes.live_session import LiveSession
+from lib.replay import load_replay, replay, summarize_latencies
+
+# Replays a transcript or recorded WAV files through the live pipeline without microphone, keyboard
+# hooks or Google, and reports end-to-end latency percentiles per segment. Examples:
+#   python replay.py transcripts/transcript_latest.txt --speed 10
+#   python replay.py talk.wav --text talk.txt --speed 4 --output timings/replay.json
+
+parser = argparse.ArgumentParser()
+parser.add_argument('sources', nargs='+', help="a transcript .txt file or 16 bit mono .wav files")
+parser.add_argument('--text', help="transcript the fake recognizer returns for the WAV files")
+parser.add_argument('--speed', type=float, default=1.0, help="timeline speed up, 0 for as fast as possible")
+parser.add_argument('--lang', default='de')
+parser.add_argument('--words-per-segment', type=int, default=12)
+parser.add_argument('--words-per-minute', type=int, default=150)
+parser.add_argument('--recognition-delay', type=float, default=.2, help="fake recognizer delay per utterance")
+parser.add_argument('--failure-rate', type=float, default=0)
+parser.add_argument('--slow-rate', type=float, default=0)
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--worker-process', action='store_true')
+parser.add_argument('--output', help="also write the summary to this JSON file")
+
+
+def main():
+    args = parser.parse_args()
+
+    segments, recognizer = load_replay(args.sources, args.text, args.words_per_segment, args.words_per_minute,
+                                       first_partial_delay=args.recognition_delay, failure_rate=args.failure_rate,
+                                       slow_rate=args.slow_rate, seed=args.seed)
+    print(f"Replaying {len(segments)} segments at speed {args.speed}...")
+
+    processor = BackgroundProcessor(use_worker_process=args.worker_process, name='replay')
+    with tempfile.TemporaryDirectory() as transcript_folder:
+        session = LiveSession('replay', args.lang, processor, transcript_folder=transcript_folder + "/")
+        try:
+            latencies = replay(session, segments, args.speed, recognizer)
+        finally:
+            session.close()
+
+    summary = summarize_latencies(latencies)
+    summary['dropped_tasks'] = processor.dropped_tasks
+    summary['processed_tasks'] = processor.processed_tasks
+    print(json.dumps(summary, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()